@@ -0,0 +1,323 @@
+"""
+An asyncio engine for the copy -> rotate pipeline.
+
+It makes the same Sheets REST calls as `programs.copy()`, but over an async
+HTTP client so many client copies can be in flight on one thread.
+
+More in flight stops helping at a few dozen. httpcore reassigns the whole
+connection pool each time a request starts or finishes, and that pass scans
+every connection (once per idle connection, and again per queued request),
+so it grows with the square of the pool size and runs on the event loop.
+With 48 or more in flight, requests queue for a connection the loop hasn't
+got round to handing them, and idle connections are closed and reopened
+(95 connections for 48 slots). `autoprog.ASYNC_WORKERS` is the measured
+best.
+"""
+
+import asyncio
+import time
+from typing import Optional
+
+import httplib2
+import httpx
+from google.auth.transport.requests import Request
+from googleapiclient.errors import HttpError
+
+from helpers import async_retry_operation, retry_after
+from journal import RunJournal
+from metrics import CURRENT_CLIENT, METRICS
+from planner import Plan, PlannedCopy
+from programs import (
+    CopyResult,
+    CopySheet,
+    ReadIndex,
+    copy_steps,
+    resume,
+    rotate_requests,
+)
+from ratelimit import LIMITER, request_kind
+from sheet_index import SHEET_INDEX_FIELDS, SheetIndex
+from transport import CONNECT_TIMEOUT, READ_TIMEOUT
+
+SHEETS_API_URL = "https://sheets.googleapis.com/v4"
+
+
+class AsyncSheetsClient:
+    """
+    A small async client for the handful of Sheets endpoints we use.
+
+    Errors are raised as `HttpError`, the same as the blocking client, so the
+    retry helpers treat both engines alike. Requests share the process-wide
+    rate limiter with the blocking client.
+
+    Args:
+        creds (Credentials): The Google credentials to authorize with.
+        max_connections (int): The size of the connection pool.
+        connect_timeout (float): Seconds to wait for a new connection.
+        read_timeout (float): Seconds to wait for each response.
+    """
+
+    def __init__(
+        self,
+        creds,
+        max_connections: int = 32,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+    ):
+        self.creds = creds
+        self._http = httpx.AsyncClient(
+            base_url=SHEETS_API_URL,
+            limits=httpx.Limits(max_connections=max_connections),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+        self._refresh_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._http.aclose()
+
+    async def _authorization(self) -> dict:
+        """Returns the auth header, refreshing the token first if it's stale."""
+        if not self.creds.valid:
+            async with self._refresh_lock:
+                if not self.creds.valid:
+                    await asyncio.to_thread(self.creds.refresh, Request())
+        return {"Authorization": f"Bearer {self.creds.token}"}
+
+    async def request(self, method: str, path: str, method_id: str, **kwargs) -> dict:
+        """
+        Sends one request and returns the decoded JSON body.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The path below `SHEETS_API_URL`.
+            method_id (str): The API method, recorded in `METRICS`, e.g.
+                "sheets.spreadsheets.get".
+            **kwargs: Passed through to `httpx.AsyncClient.request()`.
+
+        Raises:
+            HttpError: If the API answers with an error status.
+        """
+        kind = request_kind(method)
+        await LIMITER.acquire_async(kind)
+        headers = await self._authorization()
+        start = time.monotonic()
+        try:
+            response = await self._http.request(method, path, headers=headers, **kwargs)
+        except httpx.HTTPError:
+            METRICS.record(method_id, kind, None, time.monotonic() - start)
+            raise
+        METRICS.record(
+            method_id,
+            kind,
+            response.status_code,
+            time.monotonic() - start,
+            len(response.content),
+        )
+        if response.is_error:
+            resp = httplib2.Response(
+                {"status": response.status_code, **response.headers}
+            )
+            error = HttpError(resp, response.content, uri=str(response.url))
+            if response.status_code == 429:
+                LIMITER.throttled(kind, retry_after(error))
+            raise error
+        LIMITER.succeeded(kind)
+        return response.json()
+
+
+async def spreadsheets_sheets_copyto(
+    client: AsyncSheetsClient,
+    source_spreadsheet: str,
+    source_sheet: int,
+    destination: str,
+) -> dict:
+    """
+    Copies the sheet from one spreadsheet to another.
+
+    Args:
+        client (AsyncSheetsClient): The async Sheets client.
+        source_spreadsheet (str): The source spreadsheet ID.
+        source_sheet (int): The source sheet ID.
+        destination (str): The destination spreadsheet ID.
+
+    Returns:
+        dict: The properties of the newly created sheet.
+    """
+    return await client.request(
+        "POST",
+        f"/spreadsheets/{source_spreadsheet}/sheets/{source_sheet}:copyTo",
+        "sheets.spreadsheets.sheets.copyTo",
+        json={"destination_spreadsheet_id": destination},
+    )
+
+
+async def get_sheet_index(client: AsyncSheetsClient, spreadsheet_id: str) -> SheetIndex:
+    """
+    Reads just the sheet IDs and titles of a spreadsheet.
+
+    Args:
+        client (AsyncSheetsClient): The async Sheets client.
+        spreadsheet_id (str): The spreadsheet ID.
+    """
+    spreadsheet = await client.request(
+        "GET",
+        f"/spreadsheets/{spreadsheet_id}",
+        "sheets.spreadsheets.get",
+        params={"fields": SHEET_INDEX_FIELDS},
+    )
+    return SheetIndex.from_response(spreadsheet_id, spreadsheet)
+
+
+async def rotate_program(
+    client: AsyncSheetsClient,
+    spreadsheet_id: str,
+    sheet_id: int,
+    new_title: str,
+    index: SheetIndex,
+) -> str:
+    """
+    Renames the new program, hides the previous one and moves the new one
+    to the front, all in one batchUpdate.
+
+    Args:
+        client (AsyncSheetsClient): The async Sheets client.
+        spreadsheet_id (str): The spreadsheet ID.
+        sheet_id (int): The sheet ID of the newly copied program.
+        new_title (str): The desired new title for the sheet.
+        index (SheetIndex): The spreadsheet's sheets, updated once the
+            batchUpdate has gone through.
+
+    Returns:
+        str: The title the sheet ended up with.
+    """
+    new_title = index.unique_title(new_title)
+    previous_sheet_id = index.previous_program(new_title)
+
+    await client.request(
+        "POST",
+        f"/spreadsheets/{spreadsheet_id}:batchUpdate",
+        "sheets.spreadsheets.batchUpdate",
+        params={"fields": "spreadsheetId"},
+        json={
+            "requests": rotate_requests(sheet_id, new_title, previous_sheet_id),
+            "includeSpreadsheetInResponse": False,
+        },
+    )
+    index.set_title(sheet_id, new_title)
+    index.move(sheet_id, 0)
+    if previous_sheet_id is not None:
+        index.hide(previous_sheet_id)
+    return new_title
+
+
+async def copy(
+    client: AsyncSheetsClient,
+    plan: Plan,
+    planned: PlannedCopy,
+    journal: Optional[RunJournal] = None,
+) -> CopyResult:
+    """
+    Copy one sheet to a different spreadsheet, as `programs.copy()` does.
+
+    Makes the API calls `copy_steps()` asks for, each with retries.
+
+    Args:
+        client (AsyncSheetsClient): The async Sheets client.
+        plan (Plan): The plan from `planner.make_plan()`.
+        planned (PlannedCopy): The client to copy to, from the plan.
+        journal (RunJournal): Records each finished step, and lets a rerun
+            skip clients it already finished.
+    """
+    destination_spreadsheet_id = planned.client.spreadsheet_id
+    # Calls made from here on are counted against this client
+    CURRENT_CLIENT.set(destination_spreadsheet_id)
+
+    steps = copy_steps(
+        plan.program_name,
+        plan.month,
+        planned.target_title,
+        planned.template,
+        destination_spreadsheet_id,
+        journal,
+    )
+    step = resume(steps)
+    while not isinstance(step, CopyResult):
+        if isinstance(step, ReadIndex):
+            answer = await async_retry_operation(
+                get_sheet_index, 3, 2, client, destination_spreadsheet_id
+            )
+        elif isinstance(step, CopySheet):
+            answer = await async_retry_operation(
+                spreadsheets_sheets_copyto,
+                3,
+                2,
+                client,
+                step.source_spreadsheet,
+                step.source_sheet,
+                destination_spreadsheet_id,
+            )
+        else:
+            answer = await async_retry_operation(
+                rotate_program,
+                3,
+                2,
+                client,
+                destination_spreadsheet_id,
+                step.sheet_id,
+                step.new_title,
+                step.index,
+            )
+        step = resume(steps, answer)
+    return step
+
+
+async def copy_to_clients(
+    creds,
+    plan: Plan,
+    copies: list[PlannedCopy],
+    concurrency: int,
+    journal: Optional[RunJournal] = None,
+    connect_timeout: float = CONNECT_TIMEOUT,
+    read_timeout: float = READ_TIMEOUT,
+) -> list[CopyResult]:
+    """
+    Copy the program to every client, with at most `concurrency` copies in flight.
+
+    Args:
+        creds (Credentials): The Google credentials to authorize with.
+        plan (Plan): The plan from `planner.make_plan()`.
+        copies (list[PlannedCopy]): The clients to copy to, from the plan.
+        concurrency (int): The maximum number of copies in flight.
+        journal (RunJournal): Records each finished step, see `copy()`.
+        connect_timeout (float): Seconds to wait for a new connection.
+        read_timeout (float): Seconds to wait for each response.
+
+    Returns:
+        list[CopyResult]: One result per client, in the order they finished.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with AsyncSheetsClient(
+        creds, concurrency, connect_timeout, read_timeout
+    ) as client:
+
+        async def bounded_copy(planned: PlannedCopy) -> CopyResult:
+            async with semaphore:
+                try:
+                    return await copy(client, plan, planned, journal)
+                except Exception as e:
+                    return CopyResult(
+                        planned.client.spreadsheet_id, False, f"ERROR: {e}"
+                    )
+
+        results = []
+        for finished in asyncio.as_completed(
+            [bounded_copy(planned) for planned in copies]
+        ):
+            result = await finished
+            print(result.message)
+            results.append(result)
+        return results
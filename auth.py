@@ -0,0 +1,205 @@
+"""
+One set of Google credentials, shared by every thread and task of a run.
+
+The token in `token.json` lasts an hour, so a long run will see it expire.
+`SharedCredentials` refreshes it a few minutes early, under a lock, so a
+pool of workers that notice at the same moment causes one refresh rather
+than one each, and no request goes out with a token about to lapse. A 401
+only causes a refresh if the token it was sent with is still the current
+one. Otherwise another worker has already refreshed the token. Each
+refresh is saved back to `token.json` in one step, so an interrupted write
+can't leave a half-written token behind.
+
+Signing in through the browser only ever happens on the main thread, when
+there's no usable token at the start of a run.
+"""
+
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import threading
+from typing import Optional
+
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+TOKEN_FILE = "token.json"
+CLIENT_SECRETS_FILE = "credentials.json"
+
+# How long before expiry the token is refreshed, ahead of google-auth's own
+# 3m45s threshold so that it's always us who refreshes, once, under the lock
+REFRESH_MARGIN = timedelta(minutes=5)
+
+
+def utcnow() -> datetime:
+    """Returns the time in UTC, without tzinfo to compare with `expiry`."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def save_token(creds: Credentials, path: str):
+    """
+    Writes the credentials to `path`, replacing the old file in one step.
+
+    Args:
+        creds (Credentials): The credentials to save.
+        path (str): The token file.
+    """
+    tmp_path = f"{path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as token:
+        token.write(creds.to_json())
+    os.replace(tmp_path, path)
+
+
+class SharedCredentials(Credentials):
+    """
+    User credentials that refresh early, one thread at a time, and save themselves.
+
+    Takes the same arguments as `google.oauth2.credentials.Credentials`.
+    Set `token_file` to have every refresh written back to it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.token_file: Optional[str] = None
+        self._refresh_lock = threading.Lock()
+        # The token each thread last put on a request
+        self._sent = threading.local()
+
+    @property
+    def expired(self) -> bool:
+        """True once the token is within `REFRESH_MARGIN` of expiring."""
+        if not self.expiry:
+            return False
+        return utcnow() >= self.expiry - REFRESH_MARGIN
+
+    def apply(self, headers, token=None):
+        """Puts the token on a request, remembering which one this thread sent."""
+        super().apply(headers, token)
+        self._sent.token = token or self.token
+
+    def refresh(self, request):
+        """
+        Refreshes the token, unless another thread already replaced the one
+        this thread last sent.
+
+        Both `google_auth_httplib2.AuthorizedHttp` and `transport.PooledHttp`
+        call `apply()` and then, after a 401, `refresh()` on the same thread.
+        So a 401 for a token that has since been refreshed doesn't trigger
+        another refresh.
+
+        Args:
+            request (google.auth.transport.Request): Sends the refresh request.
+        """
+        stale_token = getattr(self._sent, "token", self.token)
+        with self._refresh_lock:
+            if self.token != stale_token and self.valid:
+                return
+            super().refresh(request)
+            if self.token_file:
+                save_token(self, self.token_file)
+
+
+def load_credentials_file(path: str, scopes: list[str]):
+    """
+    Loads a service account key or a saved user token, without ever signing in.
+
+    Args:
+        path (str): The JSON file.
+        scopes (list[str]): The scopes the credentials need.
+
+    Raises:
+        RuntimeError: If the file is a user token that can't be refreshed.
+    """
+    with open(path) as credentials_file:
+        info = json.load(credentials_file)
+    if info.get("type") == "service_account":
+        from google.oauth2 import service_account
+
+        return service_account.Credentials.from_service_account_info(
+            info, scopes=scopes
+        )
+
+    creds = SharedCredentials.from_authorized_user_info(info, scopes)
+    creds.token_file = path
+    if not creds.valid:
+        if not creds.refresh_token:
+            raise RuntimeError(f"'{path}' has no usable token, sign in again")
+        creds.refresh(Request())
+    return creds
+
+
+class CredentialManager:
+    """
+    Loads the credentials once and hands the same object to every caller.
+
+    Args:
+        token_file (str): Where the user's access and refresh tokens are kept.
+        client_secrets_file (str): The OAuth client, used to sign in when
+            there's no usable token.
+    """
+
+    def __init__(
+        self,
+        token_file: str = TOKEN_FILE,
+        client_secrets_file: str = CLIENT_SECRETS_FILE,
+    ):
+        self.token_file = token_file
+        self.client_secrets_file = client_secrets_file
+        self._creds: Optional[SharedCredentials] = None
+        self._lock = threading.Lock()
+
+    def get(self, scopes: list[str]) -> SharedCredentials:
+        """
+        Returns the process's credentials, loading or signing in on first use.
+
+        Args:
+            scopes (list[str]): The scopes the credentials need.
+
+        Raises:
+            RuntimeError: If signing in is needed and this isn't the main thread.
+        """
+        with self._lock:
+            if self._creds is None:
+                self._creds = self._load(scopes)
+            return self._creds
+
+    def _load(self, scopes: list[str]) -> SharedCredentials:
+        creds = None
+        if os.path.exists(self.token_file):
+            print(f"Found '{self.token_file}' file")
+            creds = SharedCredentials.from_authorized_user_file(self.token_file, scopes)
+            creds.token_file = self.token_file
+            if not creds.valid and creds.refresh_token:
+                try:
+                    creds.refresh(Request())
+                except RefreshError as e:
+                    print(f"Could not refresh '{self.token_file}': {e}")
+                    creds = None
+        if creds is not None and creds.valid:
+            return creds
+
+        # The browser flow blocks on a local server, so never start it from a
+        # worker, where it would stall the pool and race other sign-ins
+        if threading.current_thread() is not threading.main_thread():
+            raise RuntimeError(
+                f"No valid '{self.token_file}', run autoprog.py from a terminal "
+                "to sign in"
+            )
+        from google_auth_oauthlib.flow import InstalledAppFlow
+
+        flow = InstalledAppFlow.from_client_secrets_file(
+            self.client_secrets_file, scopes
+        )
+        creds = SharedCredentials.from_authorized_user_info(
+            json.loads(flow.run_local_server(port=0).to_json()), scopes
+        )
+        creds.token_file = self.token_file
+        # Save the credentials for the next run
+        save_token(creds, self.token_file)
+        return creds
+
+
+# The credentials of this process, from token.json
+CREDENTIALS = CredentialManager()
@@ -2,27 +2,101 @@
 A script that copies a program from a template into multiple
 client spreadsheets.
 
+Each copy is renamed to "PROGRAM - MM/YY", moved to the front, and last
+month's program is hidden, all in a single batchUpdate
+(`programs.rotate_program()`).
+
 Usage: change constants according to what is desired, then run
 
+    python autoprog.py [options]
+
+Options:
+    --workers N          copy to N clients at once instead of one at a time
+    --async              run the copies as coroutines on one thread
+                         (`aiosheets.py`), --workers caps how many are in flight
+                         (`ASYNC_WORKERS` unless given)
+    --batch              send the batchUpdates through the API's batch
+                         endpoint, up to 100 clients per round trip
+                         (`batching.py`)
+    --refresh-templates  fetch the Programs range again instead of using the
+                         copy cached for `TEMPLATE_CACHE_TTL` seconds
+    --journal PATH       record finished steps so a rerun after a failure
+                         skips clients that are done (`journal.py`)
+    --no-journal         don't keep a journal
+    --dry-run            print the plan (client, template, new title and
+                         operations) without changing anything (`planner.py`)
+    --export-plan PATH   also write the plan to PATH as JSON
+    --transport pooled   share one keep-alive, gzip'd connection pool between
+                         all workers instead of a connection per thread
+                         (`transport.py`)
+    --connect-timeout S  seconds to wait for a connection (pooled or --async)
+    --read-timeout S     seconds to wait for each response
+    --stream             read the clients 500 rows at a time, copying to the
+                         first ones (with --workers threads) while the rest
+                         are still being read
+    --shard-credentials FILE [FILE ...]
+                         split the clients by a stable hash of their
+                         spreadsheet ID between one process per credentials
+                         file, each with its own quota (`sharding.py`)
+    --sync               push fixes made to the template after the run into
+                         this month's sheets, cell by cell, leaving cells
+                         that are blank in the template alone (`sync.py`);
+                         with --dry-run, only count the cells that differ
+    --metrics-log PATH   append every API call (method, latency, size, status,
+                         attempt, client) to PATH as JSON lines
+
+Every run signs in once and shares the credentials between all its workers,
+refreshing the token ahead of expiry (`auth.py`). Every request is
+throttled to the Sheets quotas set in `ratelimit.py`, and
+services are built from the pinned discovery document in `discovery/`
+(`service.py`). `benchmarks/startup.py` times a cold start, and
+`benchmarks/throughput.py` times whole runs against a local fake of the API.
+Each run ends with a summary of the calls it made (`metrics.py`): latency
+percentiles per endpoint, quota used per minute and time per client.
+
 Future enhancements:
-* Hide the old program (store last added sheet, lookup, then hide)
 * CLI with multiple actions:
     * Copy new program to all active clients
     * Copy base sheet for new client
-    * Dry run or test mode
 """
 
-from __future__ import print_function
+from __future__ import annotations, print_function
+import argparse
 from collections import namedtuple
-from datetime import datetime
-import os.path
-from googleapiclient.discovery import build, Resource
+from contextlib import nullcontext
+import queue
+import re
+import threading
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
 from googleapiclient.errors import HttpError
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
 
-from helpers import retry_operation
+from batching import UpdateBatcher
+from catalog import TemplateCatalog, invalidate_cache, read_cache, write_cache
+from helpers import execute
+from journal import JOURNAL_FILE, RunJournal
+from metrics import METRICS
+from planner import (
+    COPY_OPERATIONS,
+    Plan,
+    PlannedCopy,
+    export_plan,
+    make_plan,
+    print_plan,
+)
+from programs import (
+    CopyResult,
+    copy_in_worker,
+    current_month,
+    execute_plan,
+    new_program_title,
+)
+from service import build_service
+from transport import CONNECT_TIMEOUT, READ_TIMEOUT, TRANSPORTS, Transport
+
+# The Google client and auth libraries take a good part of a second to import,
+# so they're only imported once a command actually needs them
+if TYPE_CHECKING:
+    from googleapiclient.discovery import Resource
 
 
 # If modifying these scopes, delete the file token.json
@@ -43,10 +117,31 @@ DATA_CLIENTS_RANGE = "Client Spreadsheets!A2:B"
 # uncomment the following line to use testing data
 # DATA_CLIENTS_RANGE = "TESTDATA Client Spreadsheets!A2:B"
 
+# How long the cached Programs range is reused (see `catalog.py`)
+TEMPLATE_CACHE_TTL = 60 * 60  # seconds
+TEMPLATE_CACHE_SOURCE = f"{DATA_SPREADSHEET_ID}/{DATA_PROGRAMS_RANGE}"
+
+# With --stream, the roster is read this many rows at a time, and at most
+# ROSTER_QUEUE_SIZE clients wait for a worker before reading pauses
+ROSTER_CHUNK_SIZE = 500
+ROSTER_QUEUE_SIZE = 1000
+
+# How many copies --async keeps in flight when --workers isn't given. Measured
+# with benchmarks/throughput.py (300 clients, 200 ms per call): 16 in flight
+# took 12.4 s, 24 took 8.8 s, 32 took 6.7 s, 48 took 16.1 s and 64 took 20.5 s.
+# Past about 32 the connection pool's bookkeeping, see `aiosheets.py`, costs
+# more than the extra concurrency gains. The slower the API answers the more
+# in flight pay off: at 20 ms per call 8 in flight did best (1.3 s for 100
+# clients, against 2.6 s for 32).
+ASYNC_WORKERS = 32
+
 # This is for the `test_print()` function
 SPREADSHEET_ID = "1tu0jNOpXEqCeEN4UKvk_Av5DE46CPNCjXBjDYZ6jhHQ"
 RANGE_NAME = "Client Spreadsheets!A2:B"
 
+# A row of the Client Spreadsheets range
+Client = namedtuple("Client", ["client_name", "spreadsheet_id"])
+
 
 def get_template_programs(service: Resource) -> list[list[str]]:
     """
@@ -68,258 +163,153 @@ def get_template_programs(service: Resource) -> list[list[str]]:
             # ...
         ]
     """
-    return (
+    return execute(
         service.spreadsheets()
         .values()
         .get(spreadsheetId=DATA_SPREADSHEET_ID, range=DATA_PROGRAMS_RANGE)
-        .execute()
-        .get("values", [])
-    )
+    ).get("values", [])
 
 
-def spreadsheets_sheets_copyto(
-    service: Resource,
-    source_spreadsheet: str,
-    source_sheet: int,
-    destination: str,
-) -> dict:
+def get_template_catalog(service: Resource) -> TemplateCatalog:
     """
-    Copies the sheet from one spreadsheet to another.
+    Returns the template programs indexed by name, from the cache when it's fresh.
 
     Args:
         service (Resource): The Google API service object.
-        program_name (str): The name of the program.
-        source_spreadsheet (str): The source spreadsheet ID.
-        source_sheet (int): The source sheet ID.
-        destination (str): The destination spreadsheet ID.
-
-    Returns:
-        dict: The properties of the newly created sheet in the following form:
-
-        { # Properties of a sheet.
-            "dataSourceSheetProperties": { # Additional properties of a DATA_SOURCE sheet. # Output only. If present, the field contains DATA_SOURCE sheet specific properties.
-                "columns": [ # The columns displayed on the sheet, corresponding to the values in RowData.
-                { # A column in a data source.
-                    "formula": "A String", # The formula of the calculated column.
-                    "reference": { # An unique identifier that references a data source column. # The column reference.
-                    "name": "A String", # The display name of the column. It should be unique within a data source.
-                    },
-                },
-                ],
-                "dataExecutionStatus": { # The data execution status. A data execution is created to sync a data source object with the latest data from a DataSource. It is usually scheduled to run at background, you can check its state to tell if an execution completes There are several scenarios where a data execution is triggered to run: * Adding a data source creates an associated data source sheet as well as a data execution to sync the data from the data source to the sheet. * Updating a data source creates a data execution to refresh the associated data source sheet similarly. * You can send refresh request to explicitly refresh one or multiple data source objects. # The data execution status.
-                "errorCode": "A String", # The error code.
-                "errorMessage": "A String", # The error message, which may be empty.
-                "lastRefreshTime": "A String", # Gets the time the data last successfully refreshed.
-                "state": "A String", # The state of the data execution.
-                },
-                "dataSourceId": "A String", # ID of the DataSource the sheet is connected to.
-            },
-            "gridProperties": { # Properties of a grid. # Additional properties of the sheet if this sheet is a grid. (If the sheet is an object sheet, containing a chart or image, then this field will be absent.) When writing it is an error to set any grid properties on non-grid sheets. If this sheet is a DATA_SOURCE sheet, this field is output only but contains the properties that reflect how a data source sheet is rendered in the UI, e.g. row_count.
-                "columnCount": 42, # The number of columns in the grid.
-                "columnGroupControlAfter": True or False, # True if the column grouping control toggle is shown after the group.
-                "frozenColumnCount": 42, # The number of columns that are frozen in the grid.
-                "frozenRowCount": 42, # The number of rows that are frozen in the grid.
-                "hideGridlines": True or False, # True if the grid isn't showing gridlines in the UI.
-                "rowCount": 42, # The number of rows in the grid.
-                "rowGroupControlAfter": True or False, # True if the row grouping control toggle is shown after the group.
-            },
-            "hidden": True or False, # True if the sheet is hidden in the UI, false if it's visible.
-            "index": 42, # The index of the sheet within the spreadsheet. When adding or updating sheet properties, if this field is excluded then the sheet is added or moved to the end of the sheet list. When updating sheet indices or inserting sheets, movement is considered in "before the move" indexes. For example, if there were three sheets (S1, S2, S3) in order to move S1 ahead of S2 the index would have to be set to 2. A sheet index update request is ignored if the requested index is identical to the sheets current index or if the requested new index is equal to the current sheet index + 1.
-            "rightToLeft": True or False, # True if the sheet is an RTL sheet instead of an LTR sheet.
-            "sheetId": 42, # The ID of the sheet. Must be non-negative. This field cannot be changed once set.
-            "sheetType": "A String", # The type of sheet. Defaults to GRID. This field cannot be changed once set.
-            "tabColor": { # Represents a color in the RGBA color space. This representation is designed for simplicity of conversion to and from color representations in various languages over compactness. For example, the fields of this representation can be trivially provided to the constructor of `java.awt.Color` in Java; it can also be trivially provided to UIColor's `+colorWithRed:green:blue:alpha` method in iOS; and, with just a little work, it can be easily formatted into a CSS `rgba()` string in JavaScript. This reference page doesn't have information about the absolute color space that should be used to interpret the RGB value—for example, sRGB, Adobe RGB, DCI-P3, and BT.2020. By default, applications should assume the sRGB color space. When color equality needs to be decided, implementations, unless documented otherwise, treat two colors as equal if all their red, green, blue, and alpha values each differ by at most `1e-5`. Example (Java): import com.google.type.Color; // ... public static java.awt.Color fromProto(Color protocolor) { float alpha = protocolor.hasAlpha() ? protocolor.getAlpha().getValue() : 1.0; return new java.awt.Color( protocolor.getRed(), protocolor.getGreen(), protocolor.getBlue(), alpha); } public static Color toProto(java.awt.Color color) { float red = (float) color.getRed(); float green = (float) color.getGreen(); float blue = (float) color.getBlue(); float denominator = 255.0; Color.Builder resultBuilder = Color .newBuilder() .setRed(red / denominator) .setGreen(green / denominator) .setBlue(blue / denominator); int alpha = color.getAlpha(); if (alpha != 255) { result.setAlpha( FloatValue .newBuilder() .setValue(((float) alpha) / denominator) .build()); } return resultBuilder.build(); } // ... Example (iOS / Obj-C): // ... static UIColor* fromProto(Color* protocolor) { float red = [protocolor red]; float green = [protocolor green]; float blue = [protocolor blue]; FloatValue* alpha_wrapper = [protocolor alpha]; float alpha = 1.0; if (alpha_wrapper != nil) { alpha = [alpha_wrapper value]; } return [UIColor colorWithRed:red green:green blue:blue alpha:alpha]; } static Color* toProto(UIColor* color) { CGFloat red, green, blue, alpha; if (![color getRed:&red green:&green blue:&blue alpha:&alpha]) { return nil; } Color* result = [[Color alloc] init]; [result setRed:red]; [result setGreen:green]; [result setBlue:blue]; if (alpha <= 0.9999) { [result setAlpha:floatWrapperWithValue(alpha)]; } [result autorelease]; return result; } // ... Example (JavaScript): // ... var protoToCssColor = function(rgb_color) { var redFrac = rgb_color.red || 0.0; var greenFrac = rgb_color.green || 0.0; var blueFrac = rgb_color.blue || 0.0; var red = Math.floor(redFrac * 255); var green = Math.floor(greenFrac * 255); var blue = Math.floor(blueFrac * 255); if (!('alpha' in rgb_color)) { return rgbToCssColor(red, green, blue); } var alphaFrac = rgb_color.alpha.value || 0.0; var rgbParams = [red, green, blue].join(','); return ['rgba(', rgbParams, ',', alphaFrac, ')'].join(''); }; var rgbToCssColor = function(red, green, blue) { var rgbNumber = new Number((red << 16) | (green << 8) | blue); var hexString = rgbNumber.toString(16); var missingZeros = 6 - hexString.length; var resultBuilder = ['#']; for (var i = 0; i < missingZeros; i++) { resultBuilder.push('0'); } resultBuilder.push(hexString); return resultBuilder.join(''); }; // ... # The color of the tab in the UI. Deprecated: Use tab_color_style.
-                "alpha": 3.14, # The fraction of this color that should be applied to the pixel. That is, the final pixel color is defined by the equation: `pixel color = alpha * (this color) + (1.0 - alpha) * (background color)` This means that a value of 1.0 corresponds to a solid color, whereas a value of 0.0 corresponds to a completely transparent color. This uses a wrapper message rather than a simple float scalar so that it is possible to distinguish between a default value and the value being unset. If omitted, this color object is rendered as a solid color (as if the alpha value had been explicitly given a value of 1.0).
-                "blue": 3.14, # The amount of blue in the color as a value in the interval [0, 1].
-                "green": 3.14, # The amount of green in the color as a value in the interval [0, 1].
-                "red": 3.14, # The amount of red in the color as a value in the interval [0, 1].
-            },
-            "tabColorStyle": { # A color value. # The color of the tab in the UI. If tab_color is also set, this field takes precedence.
-                "rgbColor": { # Represents a color in the RGBA color space. This representation is designed for simplicity of conversion to and from color representations in various languages over compactness. For example, the fields of this representation can be trivially provided to the constructor of `java.awt.Color` in Java; it can also be trivially provided to UIColor's `+colorWithRed:green:blue:alpha` method in iOS; and, with just a little work, it can be easily formatted into a CSS `rgba()` string in JavaScript. This reference page doesn't have information about the absolute color space that should be used to interpret the RGB value—for example, sRGB, Adobe RGB, DCI-P3, and BT.2020. By default, applications should assume the sRGB color space. When color equality needs to be decided, implementations, unless documented otherwise, treat two colors as equal if all their red, green, blue, and alpha values each differ by at most `1e-5`. Example (Java): import com.google.type.Color; // ... public static java.awt.Color fromProto(Color protocolor) { float alpha = protocolor.hasAlpha() ? protocolor.getAlpha().getValue() : 1.0; return new java.awt.Color( protocolor.getRed(), protocolor.getGreen(), protocolor.getBlue(), alpha); } public static Color toProto(java.awt.Color color) { float red = (float) color.getRed(); float green = (float) color.getGreen(); float blue = (float) color.getBlue(); float denominator = 255.0; Color.Builder resultBuilder = Color .newBuilder() .setRed(red / denominator) .setGreen(green / denominator) .setBlue(blue / denominator); int alpha = color.getAlpha(); if (alpha != 255) { result.setAlpha( FloatValue .newBuilder() .setValue(((float) alpha) / denominator) .build()); } return resultBuilder.build(); } // ... Example (iOS / Obj-C): // ... static UIColor* fromProto(Color* protocolor) { float red = [protocolor red]; float green = [protocolor green]; float blue = [protocolor blue]; FloatValue* alpha_wrapper = [protocolor alpha]; float alpha = 1.0; if (alpha_wrapper != nil) { alpha = [alpha_wrapper value]; } return [UIColor colorWithRed:red green:green blue:blue alpha:alpha]; } static Color* toProto(UIColor* color) { CGFloat red, green, blue, alpha; if (![color getRed:&red green:&green blue:&blue alpha:&alpha]) { return nil; } Color* result = [[Color alloc] init]; [result setRed:red]; [result setGreen:green]; [result setBlue:blue]; if (alpha <= 0.9999) { [result setAlpha:floatWrapperWithValue(alpha)]; } [result autorelease]; return result; } // ... Example (JavaScript): // ... var protoToCssColor = function(rgb_color) { var redFrac = rgb_color.red || 0.0; var greenFrac = rgb_color.green || 0.0; var blueFrac = rgb_color.blue || 0.0; var red = Math.floor(redFrac * 255); var green = Math.floor(greenFrac * 255); var blue = Math.floor(blueFrac * 255); if (!('alpha' in rgb_color)) { return rgbToCssColor(red, green, blue); } var alphaFrac = rgb_color.alpha.value || 0.0; var rgbParams = [red, green, blue].join(','); return ['rgba(', rgbParams, ',', alphaFrac, ')'].join(''); }; var rgbToCssColor = function(red, green, blue) { var rgbNumber = new Number((red << 16) | (green << 8) | blue); var hexString = rgbNumber.toString(16); var missingZeros = 6 - hexString.length; var resultBuilder = ['#']; for (var i = 0; i < missingZeros; i++) { resultBuilder.push('0'); } resultBuilder.push(hexString); return resultBuilder.join(''); }; // ... # RGB color. The [`alpha`](/sheets/api/reference/rest/v4/spreadsheets/other#Color.FIELDS.alpha) value in the [`Color`](/sheets/api/reference/rest/v4/spreadsheets/other#color) object isn't generally supported.
-                "alpha": 3.14, # The fraction of this color that should be applied to the pixel. That is, the final pixel color is defined by the equation: `pixel color = alpha * (this color) + (1.0 - alpha) * (background color)` This means that a value of 1.0 corresponds to a solid color, whereas a value of 0.0 corresponds to a completely transparent color. This uses a wrapper message rather than a simple float scalar so that it is possible to distinguish between a default value and the value being unset. If omitted, this color object is rendered as a solid color (as if the alpha value had been explicitly given a value of 1.0).
-                "blue": 3.14, # The amount of blue in the color as a value in the interval [0, 1].
-                "green": 3.14, # The amount of green in the color as a value in the interval [0, 1].
-                "red": 3.14, # The amount of red in the color as a value in the interval [0, 1].
-                },
-                "themeColor": "A String", # Theme color.
-            },
-            "title": "A String", # The name of the sheet.
-            }
-
-    Links:
-        - https://developers.google.com/sheets/api/reference/rest/v4/spreadsheets.sheets/copyTo
-        - https://googleapis.github.io/google-api-python-client/docs/dyn/sheets_v4.spreadsheets.sheets.html
     """
-    return (
-        service.spreadsheets()
-        .sheets()
-        .copyTo(
-            spreadsheetId=source_spreadsheet,
-            sheetId=source_sheet,
-            body={"destination_spreadsheet_id": destination},
-        )
-        .execute()
+    return TemplateCatalog.load(
+        lambda: get_template_programs(service),
+        source=TEMPLATE_CACHE_SOURCE,
+        ttl=TEMPLATE_CACHE_TTL,
     )
 
 
-def rename_sheet(service: Resource, spreadsheet_id: str, sheet_id: int, new_title: str):
+def load_snapshot(service: Resource) -> tuple[TemplateCatalog, list[Client]]:
     """
-    Renames a sheet, handling duplicate names by appending a number.
+    Reads everything a run needs from the Data spreadsheet in one values().batchGet.
+
+    The Programs range is left out of the request when the cached catalog is
+    still fresh.
 
     Args:
         service (Resource): The Google API service object.
-        spreadsheet_id (str): The spreadsheet ID.
-        sheet_id (int): The sheet ID to rename.
-        new_title (str): The desired new title for the sheet.
+
+    Returns:
+        tuple[TemplateCatalog, list[Client]]: The template programs and the
+            clients.
     """
-    # Get all sheets in the spreadsheet to check for duplicates
-    spreadsheet = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-    existing_titles = {sheet["properties"]["title"] for sheet in spreadsheet["sheets"]}
-
-    # If the title already exists, append a number
-    base_title = new_title
-    counter = 1
-    while new_title in existing_titles:
-        new_title = f"{base_title} ({counter})"
-        counter += 1
-
-    batch_update_spreadsheet_request_body = {
-        "requests": [
-            {
-                "updateSheetProperties": {
-                    "properties": {
-                        "sheetId": sheet_id,
-                        "title": new_title,
-                    },
-                    "fields": "title",
-                }
-            }
-        ],
-        "includeSpreadsheetInResponse": True,
-    }
-    return (
+    template_rows = read_cache(TEMPLATE_CACHE_SOURCE, ttl=TEMPLATE_CACHE_TTL)
+
+    ranges = [DATA_CLIENTS_RANGE]
+    if template_rows is None:
+        ranges.append(DATA_PROGRAMS_RANGE)
+    result = execute(
         service.spreadsheets()
-        .batchUpdate(
-            spreadsheetId=spreadsheet_id, body=batch_update_spreadsheet_request_body
-        )
-        .execute()
+        .values()
+        .batchGet(spreadsheetId=DATA_SPREADSHEET_ID, ranges=ranges)
     )
+    values = [value_range.get("values", []) for value_range in result["valueRanges"]]
+
+    if template_rows is None:
+        template_rows = values[1]
+        write_cache(template_rows, TEMPLATE_CACHE_SOURCE)
+    clients = [Client(row[0], row[1]) for row in values[0]]
+    return TemplateCatalog(template_rows), clients
 
 
-def copy(service: Resource, program_name: str, destination_spreadsheet_id: str):
+def get_clients(service: Resource) -> list[Client]:
     """
-    Copy one sheet to a different spreadsheet
+    Return a list of client names and their spreadsheet ID
 
     Args:
         service (Resource): The Google API service object.
-        program_name (str): The name of the program.
-        destination_spreadsheet_id (str): The destination spreadsheet ID.
     """
+    # get the IDs from my Data.Client Spreadsheets sheet
+    result = execute(
+        service.spreadsheets()
+        .values()
+        .get(spreadsheetId=DATA_SPREADSHEET_ID, range=DATA_CLIENTS_RANGE)
+    )
+    values = result.get("values", [])
 
-    # Get the template programs
-    try:
-        data_programs = get_template_programs(service)
-    except HttpError as e:
-        print(f"ERROR: could not get template programs: {e.status_code}: {e.reason}")
-        return
-
-    template_info = None
-    for row in data_programs:
-        if row[0] == program_name:
-            template_info = row
-            break
-
-    if not template_info:
-        print(f"ERROR: could not find template for {program_name}")
-        return
-
-    source_spreadsheet: str = template_info[1]
-    source_sheet: int = template_info[2]
-
-    # Copy the sheet
-    def copy_sheet_with_retry():
-        return spreadsheets_sheets_copyto(
-            service, source_spreadsheet, source_sheet, destination_spreadsheet_id
-        ).get("sheetId")
-
-    destination_sheet = retry_operation(copy_sheet_with_retry, retries=3, delay=2)
-
-    if not destination_sheet:
-        print(f'ERROR: could not copy "{program_name}" to {destination_spreadsheet_id}')
-        return
+    return [Client(row[0], row[1]) for row in values]
 
-    # Rename the sheet
-    new_title = f"{program_name} - {datetime.now().strftime('%m/%y')}"
 
-    def rename_sheet_with_retry():
-        return rename_sheet(
-            service, destination_spreadsheet_id, destination_sheet, new_title
-        ).get("updatedSpreadsheet")
+def roster_windows(a1_range: str, chunk_size: int) -> Iterator[str]:
+    """
+    Splits an open-ended range into consecutive windows of `chunk_size` rows.
 
-    updated_spreadsheet = retry_operation(rename_sheet_with_retry, retries=3, delay=2)
+    Args:
+        a1_range (str): A range with no last row, e.g. "Client Spreadsheets!A2:B".
+        chunk_size (int): How many rows each window covers.
 
-    if updated_spreadsheet:
-        print(
-            f'SUCCESS: copied "{new_title}" sheet to {updated_spreadsheet["properties"]["title"]}'
+    Yields:
+        str: "Client Spreadsheets!A2:B501", "Client Spreadsheets!A502:B1001", ...
+    """
+    match = re.fullmatch(
+        r"(?P<sheet>.+)!(?P<first_col>[A-Z]+)(?P<first_row>\d+):(?P<last_col>[A-Z]+)",
+        a1_range,
+    )
+    if not match:
+        raise ValueError(f"Expected a range like 'Sheet!A2:B', got {a1_range!r}")
+    first_row = int(match["first_row"])
+    while True:
+        last_row = first_row + chunk_size - 1
+        yield (
+            f"{match['sheet']}!{match['first_col']}{first_row}:"
+            f"{match['last_col']}{last_row}"
         )
-    else:
-        print(f'ERROR: failed to copy and rename sheet "{new_title}"')
+        first_row = last_row + 1
 
 
-def get_clients(service: Resource) -> list[namedtuple]:
+def iter_clients(
+    service: Resource, chunk_size: int = ROSTER_CHUNK_SIZE
+) -> Iterator[Client]:
     """
-    Return a list of client names and their spreadsheet ID
+    Yield the clients one window of rows at a time, reading the next on demand.
+
+    The API leaves trailing blank rows out of each window, so a short
+    window doesn't mean the roster has ended, only an empty one does. The
+    roster must not have `chunk_size` blank rows in a row.
 
     Args:
         service (Resource): The Google API service object.
+        chunk_size (int): How many rows to read per request.
     """
-    Client = namedtuple("Client", ["client_name", "spreadsheet_id"])
+    for window in roster_windows(DATA_CLIENTS_RANGE, chunk_size):
+        result = execute(
+            service.spreadsheets()
+            .values()
+            .get(spreadsheetId=DATA_SPREADSHEET_ID, range=window)
+        )
+        rows = result.get("values", [])
+        if not rows:
+            return
+        for row in rows:
+            yield Client(row[0], row[1])
 
-    # get the IDs from my Data.Client Spreadsheets sheet
-    result = (
-        service.spreadsheets()
-        .values()
-        .get(spreadsheetId=DATA_SPREADSHEET_ID, range=DATA_CLIENTS_RANGE)
-        .execute()
-    )
-    values = result.get("values", [])
 
-    return [Client(row[0], row[1]) for row in values]
+def get_creds():
+    """
+    Get connected to Google account.
 
+    Returns the one set of credentials the whole process shares (see
+    `auth.py`), so worker threads never refresh or sign in on their own.
+    """
+    from auth import CREDENTIALS
 
-def get_creds():
-    """Get connected to Google account"""
-    creds = None
-    # The file token.json stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first
-    # time.
-    if os.path.exists("token.json"):
-        print("Found 'token.json' file")
-        creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
-            creds = flow.run_local_server(port=0)
-        # Save the credentials for the next run
-        with open("token.json", "w") as token:
-            token.write(creds.to_json())
-    return creds
+    return CREDENTIALS.get(SCOPES)
 
 
 def print_test():
     """Shows basic usage of the Sheets API.
     Prints values from a sample spreadsheet.
     """
-    service = build("sheets", "v4", credentials=get_creds())
+    service = build_service(credentials=get_creds())
 
     # Call the Sheets API
     sheet = service.spreadsheets()
-    result = (
-        sheet.values().get(spreadsheetId=SPREADSHEET_ID, range=RANGE_NAME).execute()
-    )
+    result = execute(sheet.values().get(spreadsheetId=SPREADSHEET_ID, range=RANGE_NAME))
     if values := result.get("values", []):
         client_sheets = [row[1] for row in values]
         print(client_sheets)
@@ -327,10 +317,307 @@ def print_test():
         print("No data found.")
 
 
-def main():
-    with build("sheets", "v4", credentials=get_creds()) as service:
-        for client in get_clients(service):
-            copy(service, PROGRAM_NAME, client.spreadsheet_id)
+def stream_to_clients(
+    transport: Transport,
+    plan: Plan,
+    copies: Iterable[PlannedCopy],
+    workers: int,
+    batcher: Optional[UpdateBatcher] = None,
+    journal: Optional[RunJournal] = None,
+) -> list[CopyResult]:
+    """
+    Copy the program to clients as they're read, through a bounded queue.
+
+    The calling thread reads `copies` and queues them, while `workers`
+    threads take them off the queue and copy, so the first copies start as
+    soon as the first rows arrive.
+
+    Args:
+        transport (Transport): The transport shared by every worker.
+        plan (Plan): The program, month and template, without any copies.
+        copies (Iterable[PlannedCopy]): The clients, as they're read with
+            `iter_clients()`.
+        workers (int): How many worker threads copy at once.
+        batcher (UpdateBatcher): If given, the renames are queued on it and
+            sent in batches.
+        journal (RunJournal): Records each finished step, see
+            `programs.copy()`.
+
+    Returns:
+        list[CopyResult]: One result per client read, in the order they finished.
+    """
+    results = []
+
+    def report(result: CopyResult):
+        print(result.message)
+        results.append(result)
+
+    pending = queue.Queue(maxsize=ROSTER_QUEUE_SIZE)
+
+    def work():
+        while (planned := pending.get()) is not None:
+            result = copy_in_worker(transport, plan, planned, batcher, report, journal)
+            if result:
+                report(result)
+
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        for planned in copies:
+            pending.put(planned)
+    except HttpError as e:
+        print(
+            f"ERROR: could not read the rest of the clients: {e.status_code}: {e.reason}"
+        )
+    finally:
+        # One stop signal per worker, after every client that was queued
+        for _ in threads:
+            pending.put(None)
+        for thread in threads:
+            thread.join()
+
+    if batcher is not None:
+        batcher.flush()
+    return results
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse the command line options"""
+    parser = argparse.ArgumentParser(
+        description="Copy a program from its template into client spreadsheets."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="number of clients to copy at once "
+        f"(default: 1, or {ASYNC_WORKERS} with --async)",
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="multiplex the copies on one thread with asyncio",
+    )
+    parser.add_argument(
+        "--refresh-templates",
+        action="store_true",
+        help="ignore the cached Programs range and fetch it again",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="send the renames in HTTP batches instead of one request per client",
+    )
+    parser.add_argument(
+        "--journal",
+        default=JOURNAL_FILE,
+        help="where to record finished steps so a rerun can resume "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-journal",
+        dest="journal",
+        action="store_const",
+        const=None,
+        help="don't record or skip anything, just check for this month's sheet",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="print what would be copied without changing any spreadsheet",
+    )
+    parser.add_argument(
+        "--export-plan",
+        metavar="PATH",
+        help="write the plan to PATH as JSON",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=TRANSPORTS,
+        default="httplib2",
+        help="httplib2: a connection per worker thread (default), pooled: one "
+        "keep-alive connection pool shared by every worker",
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=CONNECT_TIMEOUT,
+        metavar="SECONDS",
+        help="how long to wait for a connection with --transport pooled or "
+        "--async (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--read-timeout",
+        type=float,
+        default=READ_TIMEOUT,
+        metavar="SECONDS",
+        help="how long to wait for each response (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--shard-credentials",
+        nargs="+",
+        metavar="FILE",
+        help="split the clients between one process per credentials file "
+        "(service account keys or saved user tokens)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help=f"read the clients {ROSTER_CHUNK_SIZE} rows at a time and start "
+        "copying to the first ones while the rest are read",
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="instead of copying, push changes made to the template since the "
+        "run into this month's sheets, leaving the clients' own entries alone",
+    )
+    parser.add_argument(
+        "--metrics-log",
+        metavar="PATH",
+        help="append every API call to PATH as a line of JSON",
+    )
+    args = parser.parse_args(argv)
+    if args.workers is None:
+        args.workers = ASYNC_WORKERS if args.use_async else 1
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.batch and args.use_async:
+        parser.error("--batch can't be used with --async")
+    if args.sync and (
+        args.use_async
+        or args.batch
+        or args.stream
+        or args.export_plan
+        or args.shard_credentials
+    ):
+        parser.error(
+            "--sync can't be used with --async, --batch, --stream, --export-plan "
+            "or --shard-credentials"
+        )
+    if args.stream and (
+        args.use_async or args.dry_run or args.export_plan or args.shard_credentials
+    ):
+        parser.error(
+            "--stream can't be used with --async, --dry-run, --export-plan or "
+            "--shard-credentials, which need every client up front"
+        )
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.refresh_templates:
+        invalidate_cache()
+
+    if args.shard_credentials:
+        # The coordinator only reads, as the first shard's identity
+        from auth import load_credentials_file
+
+        creds = load_credentials_file(args.shard_credentials[0], SCOPES)
+    else:
+        creds = get_creds()
+    transport = TRANSPORTS[args.transport](
+        creds,
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout,
+    )
+    journal_context = RunJournal(args.journal) if args.journal else nullcontext()
+    with (
+        build_service(http=transport.http()) as service,
+        journal_context as journal,
+        METRICS.start(args.metrics_log),
+    ):
+        try:
+            if args.stream:
+                # Nothing is read from the roster until the copies begin
+                catalog, clients = get_template_catalog(service), iter_clients(service)
+            else:
+                catalog, clients = load_snapshot(service)
+        except HttpError as e:
+            print(
+                f"ERROR: could not read the Data spreadsheet: {e.status_code}: {e.reason}"
+            )
+            return
+
+        template = catalog.get(PROGRAM_NAME)
+        if not template:
+            print(f"ERROR: could not find template for {PROGRAM_NAME}")
+            return
+
+        # Settled once, so a run that goes past midnight at the end of the
+        # month still does what it printed
+        month = current_month()
+        target_title = new_program_title(PROGRAM_NAME, month)
+
+        if args.sync:
+            from sync import sync_clients
+
+            results = sync_clients(
+                service,
+                transport,
+                template,
+                clients,
+                target_title,
+                args.workers,
+                args.dry_run,
+            )
+            if args.dry_run:
+                return
+        elif args.stream:
+            # This thread keeps reading the roster on `service` while workers
+            # flush batches, so the batcher sends on a connection of its own
+            batcher = None
+            if args.batch:
+                batcher = UpdateBatcher(build_service(http=transport.http()))
+            # The journal is checked as each client is copied rather than up front
+            copies = (
+                PlannedCopy(client, template, target_title, COPY_OPERATIONS)
+                for client in clients
+            )
+            results = stream_to_clients(
+                transport,
+                Plan(PROGRAM_NAME, month, template, ()),
+                copies,
+                args.workers,
+                batcher,
+                journal,
+            )
+        else:
+            plan = make_plan(
+                PROGRAM_NAME,
+                month,
+                target_title,
+                template,
+                clients,
+                journal,
+            )
+            if args.export_plan:
+                export_plan(plan, args.export_plan)
+            if args.dry_run:
+                print_plan(plan)
+                return
+
+            if args.shard_credentials:
+                from sharding import run_shards
+
+                results = run_shards(plan, args.shard_credentials, SCOPES, args)
+            else:
+                results = execute_plan(
+                    plan,
+                    service,
+                    transport,
+                    args.workers,
+                    args.use_async,
+                    UpdateBatcher(service) if args.batch else None,
+                    journal,
+                )
+
+    succeeded = sum(result.ok for result in results)
+    action = "Synced" if args.sync else "Copied"
+    print(f"{action} {PROGRAM_NAME} to {succeeded}/{len(results)} clients")
+    METRICS.print_summary()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,208 @@
+"""
+Coalesces spreadsheet batchUpdate calls into multipart HTTP batch requests.
+
+Renaming (or hiding) a sheet in each client spreadsheet is a tiny
+batchUpdate per client. Instead of sending each one on its own, the calls
+are queued, requests for the same spreadsheet are merged into one
+batchUpdate, and up to `MAX_BATCH_SIZE` spreadsheets go out in a single
+round trip through the API's batch endpoint.
+
+Link:
+    - https://googleapis.github.io/google-api-python-client/docs/batch.html
+"""
+
+from __future__ import annotations
+
+from collections import namedtuple
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Optional
+from googleapiclient.errors import HttpError
+
+from helpers import backoff_delay, is_retryable, retry_after
+from metrics import METRICS
+from ratelimit import LIMITER, WRITE
+
+if TYPE_CHECKING:
+    from googleapiclient.discovery import Resource
+
+# The batch endpoint takes up to 1000 calls, but large batches are slower
+# to fail and retry, so stay well under that
+MAX_BATCH_SIZE = 100
+
+# A batchUpdate waiting to be sent, with the callbacks of everyone who
+# added requests to it
+PendingUpdate = namedtuple("PendingUpdate", ["spreadsheet_id", "requests", "callbacks"])
+
+# Called with the batchUpdate response, or with the error it failed with: an
+# HttpError, or whatever the transport raised if the batch got no response
+UpdateCallback = Callable[[Optional[dict], Optional[Exception]], None]
+
+
+class UpdateBatcher:
+    """
+    Queues batchUpdate requests and sends them in multipart batches.
+
+    The batcher sends everything with its own service, so it can be shared
+    by worker threads: only one batch is in flight at a time. The worker
+    whose `add()` fills a batch sends it, but the queue isn't locked while
+    it does. Other workers keep adding while the batch waits for quota or
+    backs off.
+
+    Args:
+        service (Resource): The Google API service object the batches go through.
+        max_batch_size (int): How many spreadsheets go in one HTTP batch.
+        retries (int): How many times a call is sent before giving up.
+        delay (int): The first delay in seconds between retries.
+    """
+
+    def __init__(
+        self,
+        service: Resource,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        retries: int = 3,
+        delay: int = 2,
+    ):
+        self.service = service
+        self.max_batch_size = max_batch_size
+        self.retries = retries
+        self.delay = delay
+        self._pending: dict[str, PendingUpdate] = {}
+        # Guards `_pending`, never held while sending
+        self._lock = threading.Lock()
+        # One batch in flight at a time, re-entrant in case a callback adds
+        self._send_lock = threading.RLock()
+
+    def add(self, spreadsheet_id: str, requests: list[dict], callback: UpdateCallback):
+        """
+        Queues requests for a spreadsheet, sending a batch once enough are queued.
+
+        Args:
+            spreadsheet_id (str): The spreadsheet the requests apply to.
+            requests (list[dict]): batchUpdate requests, e.g. updateSheetProperties.
+            callback (callable): Called once the requests have been sent.
+        """
+        with self._lock:
+            pending = self._pending.setdefault(
+                spreadsheet_id, PendingUpdate(spreadsheet_id, [], [])
+            )
+            pending.requests.extend(requests)
+            pending.callbacks.append(callback)
+            if len(self._pending) < self.max_batch_size:
+                return
+            updates = self._take()
+        self._send_all(updates)
+
+    def flush(self):
+        """Sends everything that's queued."""
+        with self._lock:
+            updates = self._take()
+        self._send_all(updates)
+
+    def _take(self) -> list[PendingUpdate]:
+        """Empties the queue and returns what was in it. Call with `_lock` held."""
+        updates = list(self._pending.values())
+        self._pending.clear()
+        return updates
+
+    def _send_all(self, updates: list[PendingUpdate]):
+        """Sends the updates, `max_batch_size` spreadsheets per HTTP batch."""
+        with self._send_lock:
+            for start in range(0, len(updates), self.max_batch_size):
+                self._send(updates[start : start + self.max_batch_size])
+
+    def _send(self, updates: list[PendingUpdate]):
+        """Sends one HTTP batch, retrying the calls that failed transiently."""
+        delay = self.delay
+        for attempt in range(1, self.retries + 1):
+            failed = self._send_once(updates, attempt)
+            retry = {
+                request_id: error
+                for request_id, error in failed.items()
+                if is_retryable(error) and attempt < self.retries
+            }
+            for request_id, error in failed.items():
+                if request_id not in retry:
+                    self._finish(updates[int(request_id)], None, error)
+            if not retry:
+                return
+
+            error = next(iter(retry.values()))
+            print(
+                f"Retry {attempt}/{self.retries}: {len(retry)} batched calls failed, "
+                f"Error {error.status_code}: {error.reason}"
+            )
+            updates = [updates[int(request_id)] for request_id in retry]
+            time.sleep(backoff_delay(error, delay))
+            delay *= 2  # Exponential backoff
+
+    def _send_once(
+        self, updates: list[PendingUpdate], attempt: int = 1
+    ) -> dict[str, HttpError]:
+        """
+        Sends the updates in one HTTP batch and returns the calls that failed.
+
+        If the batch gets no response at all (a timeout, a dropped connection),
+        every call not already answered is finished with that error instead,
+        since no other caller would ever report those clients.
+        """
+        failed = {}
+        finished = set()
+        start = time.monotonic()
+
+        def handle(request_id: str, response: dict, exception: Optional[HttpError]):
+            # Each call is recorded with the round trip of the whole batch
+            METRICS.record(
+                "sheets.spreadsheets.batchUpdate",
+                WRITE,
+                200 if exception is None else exception.status_code,
+                time.monotonic() - start,
+                client=updates[int(request_id)].spreadsheet_id,
+                attempt=attempt,
+            )
+            if exception is None:
+                LIMITER.succeeded(WRITE)
+                finished.add(request_id)
+                self._finish(updates[int(request_id)], response, None)
+                return
+            if exception.status_code == 429:
+                LIMITER.throttled(WRITE, retry_after(exception))
+            failed[request_id] = exception
+
+        batch = self.service.new_batch_http_request(callback=handle)
+        for request_id, update in enumerate(updates):
+            # Every call in a batch still counts against the write quota
+            LIMITER.acquire(WRITE)
+            batch.add(
+                self.service.spreadsheets().batchUpdate(
+                    spreadsheetId=update.spreadsheet_id,
+                    body={"requests": update.requests},
+                    fields="spreadsheetId",
+                ),
+                request_id=str(request_id),
+            )
+        try:
+            batch.execute()
+        except HttpError as e:
+            # The batch itself failed, so none of its calls went through
+            METRICS.record(
+                "batch", WRITE, e.status_code, time.monotonic() - start, attempt=attempt
+            )
+            return {str(request_id): e for request_id in range(len(updates))}
+        except Exception as e:
+            METRICS.record(
+                "batch", WRITE, None, time.monotonic() - start, attempt=attempt
+            )
+            print(f"ERROR: batch of {len(updates)} calls failed: {e}")
+            for request_id, update in enumerate(updates):
+                if str(request_id) not in finished:
+                    self._finish(update, None, failed.get(str(request_id), e))
+            return {}
+        return failed
+
+    @staticmethod
+    def _finish(
+        update: PendingUpdate, response: Optional[dict], error: Optional[Exception]
+    ):
+        for callback in update.callbacks:
+            callback(response, error)
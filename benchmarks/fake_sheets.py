@@ -0,0 +1,506 @@
+"""
+A local stand-in for the Sheets API, for benchmarks.
+
+It implements the endpoints autoprog uses (values.get, values.batchGet,
+values.batchUpdate, spreadsheets.get, sheets.copyTo, batchUpdate and the
+multipart batch endpoint) over spreadsheets kept in memory, and can add latency, 429s and
+5xx errors to see how the client copes.
+
+    server = FakeSheetsServer(latency=0.05, error_rate=0.01)
+    server.start()
+    service = build_service(http=httplib2.Http(), root_url=server.url)
+"""
+
+from collections import Counter
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import threading
+import time
+from typing import Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+# A range like "Client Spreadsheets!A2:B" or "'Programs'!A2:C501"
+A1_RANGE = re.compile(
+    r"^(?P<sheet>.+?)!(?P<start_col>[A-Z]+)(?P<start_row>\d*)"
+    r"(?::(?P<end_col>[A-Z]+)(?P<end_row>\d*))?$"
+)
+
+STATUS_NAMES = {
+    400: "INVALID_ARGUMENT",
+    404: "NOT_FOUND",
+    429: "RESOURCE_EXHAUSTED",
+    500: "INTERNAL",
+    503: "UNAVAILABLE",
+}
+
+
+class ApiError(Exception):
+    """An error response, raised by the fake endpoints."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+    def body(self) -> dict:
+        return {
+            "error": {
+                "code": self.status,
+                "message": self.message,
+                "status": STATUS_NAMES.get(self.status, "UNKNOWN"),
+            }
+        }
+
+
+def column_number(letters: str) -> int:
+    """Returns the 0-based column of "A", "B", ..., "AA"."""
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord("A") + 1
+    return number - 1
+
+
+def unquote_title(title: str) -> str:
+    """Returns a sheet title from an A1 range without its quotes."""
+    if title.startswith("'") and title.endswith("'"):
+        return title[1:-1].replace("''", "'")
+    return title
+
+
+def parse_range(a1_range: str) -> tuple[str, int, Optional[int], int, Optional[int]]:
+    """
+    Splits an A1 range into its sheet title and 0-based bounds.
+
+    Args:
+        a1_range (str): The range, e.g. "Programs!A2:C" or "'602 - 10/26'".
+
+    Returns:
+        tuple: (sheet title, first row, last row or None, first column, last
+            column or None), the last row and column included.
+    """
+    if "!" not in a1_range:
+        # Just a sheet title, meaning the whole sheet
+        return unquote_title(a1_range), 0, None, 0, None
+    match = A1_RANGE.match(a1_range)
+    if not match:
+        raise ApiError(400, f"Unable to parse range: {a1_range}")
+    sheet = unquote_title(match["sheet"])
+    start_row = int(match["start_row"] or 1) - 1
+    if match["end_row"]:
+        end_row = int(match["end_row"]) - 1
+    elif match["end_col"] or not match["start_row"]:
+        end_row = None
+    else:
+        # A single cell, e.g. "Sheet!D10"
+        end_row = start_row
+    start_col = column_number(match["start_col"])
+    end_col = column_number(match["end_col"]) if match["end_col"] else start_col
+    return sheet, start_row, end_row, start_col, end_col
+
+
+class FakeSpreadsheets:
+    """
+    The spreadsheets the fake server holds, safe to use from its handler threads.
+
+    Each sheet is stored as its properties plus a grid of cell values.
+    """
+
+    def __init__(self):
+        self._books = {}
+        self._next_sheet_id = 1000
+        self._lock = threading.RLock()
+
+    def add_spreadsheet(self, spreadsheet_id: str, title: str):
+        """Creates an empty spreadsheet."""
+        with self._lock:
+            self._books[spreadsheet_id] = {"title": title, "sheets": []}
+
+    def add_sheet(
+        self,
+        spreadsheet_id: str,
+        title: str,
+        rows: Optional[list[list[str]]] = None,
+        sheet_id: Optional[int] = None,
+        hidden: bool = False,
+    ) -> int:
+        """
+        Appends a sheet to a spreadsheet.
+
+        Args:
+            spreadsheet_id (str): The spreadsheet.
+            title (str): The sheet title.
+            rows (list[list[str]]): The cell values, starting at A1.
+            sheet_id (int): The sheet ID, a new one if not given.
+            hidden (bool): Whether the sheet is hidden.
+
+        Returns:
+            int: The sheet ID.
+        """
+        with self._lock:
+            sheets = self._book(spreadsheet_id)["sheets"]
+            if sheet_id is None:
+                sheet_id = self._next_sheet_id
+                self._next_sheet_id += 1
+            properties = {
+                "sheetId": sheet_id,
+                "title": title,
+                "index": len(sheets),
+                "hidden": hidden,
+            }
+            sheets.append(
+                {"properties": properties, "rows": [list(row) for row in rows or []]}
+            )
+            return sheet_id
+
+    def _book(self, spreadsheet_id: str) -> dict:
+        try:
+            return self._books[spreadsheet_id]
+        except KeyError:
+            raise ApiError(404, "Requested entity was not found.") from None
+
+    def _sheet(self, spreadsheet_id: str, sheet_id=None, title=None) -> dict:
+        for sheet in self._book(spreadsheet_id)["sheets"]:
+            properties = sheet["properties"]
+            if properties["sheetId"] == sheet_id or properties["title"] == title:
+                return sheet
+        if title is not None:
+            raise ApiError(400, f"Unable to parse range: {title}")
+        raise ApiError(400, f"No grid with id: {sheet_id}")
+
+    def sheets(self, spreadsheet_id: str) -> list[dict]:
+        """Returns a copy of each sheet's properties, in tab order."""
+        with self._lock:
+            return [
+                dict(sheet["properties"])
+                for sheet in self._book(spreadsheet_id)["sheets"]
+            ]
+
+    def get(self, spreadsheet_id: str) -> dict:
+        """spreadsheets.get, with the properties `SHEET_INDEX_FIELDS` asks for."""
+        with self._lock:
+            return {
+                "spreadsheetId": spreadsheet_id,
+                "properties": {"title": self._book(spreadsheet_id)["title"]},
+                "sheets": [
+                    {"properties": properties}
+                    for properties in self.sheets(spreadsheet_id)
+                ],
+            }
+
+    def get_values(self, spreadsheet_id: str, a1_range: str) -> dict:
+        """spreadsheets.values.get"""
+        title, start_row, end_row, start_col, end_col = parse_range(a1_range)
+        with self._lock:
+            rows = self._sheet(spreadsheet_id, title=title)["rows"]
+            stop_row = None if end_row is None else end_row + 1
+            stop_col = None if end_col is None else end_col + 1
+            values = [list(row[start_col:stop_col]) for row in rows[start_row:stop_row]]
+        while values and not any(values[-1]):
+            values.pop()
+        value_range = {"range": a1_range, "majorDimension": "ROWS"}
+        if values:
+            value_range["values"] = values
+        return value_range
+
+    def batch_get_values(self, spreadsheet_id: str, ranges: list[str]) -> dict:
+        """spreadsheets.values.batchGet"""
+        return {
+            "spreadsheetId": spreadsheet_id,
+            "valueRanges": [
+                self.get_values(spreadsheet_id, a1_range) for a1_range in ranges
+            ],
+        }
+
+    def batch_update_values(self, spreadsheet_id: str, body: dict) -> dict:
+        """spreadsheets.values.batchUpdate"""
+        updated = 0
+        with self._lock:
+            for value_range in body.get("data", []):
+                title, start_row, _, start_col, _ = parse_range(value_range["range"])
+                rows = self._sheet(spreadsheet_id, title=title)["rows"]
+                for row_offset, values in enumerate(value_range.get("values", [])):
+                    while len(rows) <= start_row + row_offset:
+                        rows.append([])
+                    row = rows[start_row + row_offset]
+                    for col_offset, value in enumerate(values):
+                        column = start_col + col_offset
+                        row.extend([""] * (column + 1 - len(row)))
+                        row[column] = value
+                        updated += 1
+        return {"spreadsheetId": spreadsheet_id, "totalUpdatedCells": updated}
+
+    def copy_to(self, spreadsheet_id: str, sheet_id: int, body: dict) -> dict:
+        """spreadsheets.sheets.copyTo"""
+        # Like the real API, take the field in camelCase or snake_case
+        destination_id = body.get("destinationSpreadsheetId") or body.get(
+            "destination_spreadsheet_id"
+        )
+        with self._lock:
+            source = self._sheet(spreadsheet_id, sheet_id=sheet_id)
+            titles = {properties["title"] for properties in self.sheets(destination_id)}
+            title = base_title = f"Copy of {source['properties']['title']}"
+            counter = 1
+            while title in titles:
+                counter += 1
+                title = f"{base_title} {counter}"
+            new_sheet_id = self.add_sheet(destination_id, title, source["rows"])
+            return self._sheet(destination_id, sheet_id=new_sheet_id)["properties"]
+
+    def batch_update(self, spreadsheet_id: str, body: dict) -> dict:
+        """spreadsheets.batchUpdate, for updateSheetProperties requests."""
+        with self._lock:
+            sheets = self._book(spreadsheet_id)["sheets"]
+            replies = []
+            for request in body.get("requests", []):
+                update = request.get("updateSheetProperties")
+                if update is None:
+                    raise ApiError(400, f"Unsupported request: {sorted(request)}")
+                properties = update["properties"]
+                sheet = self._sheet(spreadsheet_id, sheet_id=properties["sheetId"])
+                for field in update["fields"].split(","):
+                    if field == "index":
+                        sheets.remove(sheet)
+                        sheets.insert(properties["index"], sheet)
+                    elif field in ("title", "hidden"):
+                        if field == "title" and any(
+                            other is not sheet
+                            and other["properties"]["title"] == properties["title"]
+                            for other in sheets
+                        ):
+                            raise ApiError(
+                                400,
+                                f"A sheet with the name \"{properties['title']}\" "
+                                "already exists.",
+                            )
+                        sheet["properties"][field] = properties[field]
+                    else:
+                        raise ApiError(400, f"Unsupported field: {field}")
+                for position, other in enumerate(sheets):
+                    other["properties"]["index"] = position
+                replies.append({})
+            response = {"spreadsheetId": spreadsheet_id, "replies": replies}
+            if body.get("includeSpreadsheetInResponse"):
+                response["updatedSpreadsheet"] = self.get(spreadsheet_id)
+            return response
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # Every worker connects at once, far more than the default backlog of 5,
+    # and a dropped SYN costs a second before the client tries again
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class FakeSheetsServer:
+    """
+    Serves `FakeSpreadsheets` over HTTP on localhost, on a background thread.
+
+    Every call (and every part of a batch) waits `latency` seconds and then
+    fails with 429 or 503 at the given rates, so the retry and throttling
+    paths get exercised too.
+
+    Args:
+        spreadsheets (FakeSpreadsheets): The data to serve, empty if not given.
+        latency (float): Seconds added to every call.
+        rate_limit_rate (float): The share of calls answered with 429.
+        error_rate (float): The share of calls answered with 503.
+        seed (int): Seeds the error injection, so runs can be repeated.
+    """
+
+    def __init__(
+        self,
+        spreadsheets: Optional[FakeSpreadsheets] = None,
+        latency: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.spreadsheets = spreadsheets or FakeSpreadsheets()
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.stats = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = _HTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """The root URL to pass to `build_service()`."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Starts serving in the background."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops serving and closes the socket."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _inject_fault(self):
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            self.count("429s")
+            raise ApiError(429, "Quota exceeded for quota metric 'Write requests'.")
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.count("5xxs")
+            raise ApiError(503, "The service is currently unavailable.")
+
+    def call(self, method: str, url: str, body: bytes) -> tuple[int, dict]:
+        """
+        Answers one API call.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The path and query string.
+            body (bytes): The request body.
+
+        Returns:
+            tuple[int, dict]: The status and JSON body of the response.
+        """
+        parts = urlsplit(url)
+        path = unquote(parts.path)
+        query = parse_qs(parts.query)
+        spreadsheets = self.spreadsheets
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            self._inject_fault()
+            payload = json.loads(body) if body else {}
+
+            if method == "GET" and (
+                match := re.fullmatch(r"/v4/spreadsheets/([^/]+)/values:batchGet", path)
+            ):
+                self.count("values.batchGet")
+                response = spreadsheets.batch_get_values(
+                    match[1], query.get("ranges", [])
+                )
+            elif method == "POST" and (
+                match := re.fullmatch(
+                    r"/v4/spreadsheets/([^/]+)/values:batchUpdate", path
+                )
+            ):
+                self.count("values.batchUpdate")
+                response = spreadsheets.batch_update_values(match[1], payload)
+            elif method == "GET" and (
+                match := re.fullmatch(r"/v4/spreadsheets/([^/]+)/values/(.+)", path)
+            ):
+                self.count("values.get")
+                response = spreadsheets.get_values(match[1], match[2])
+            elif method == "GET" and (
+                match := re.fullmatch(r"/v4/spreadsheets/([^/:]+)", path)
+            ):
+                self.count("spreadsheets.get")
+                response = spreadsheets.get(match[1])
+            elif method == "POST" and (
+                match := re.fullmatch(
+                    r"/v4/spreadsheets/([^/]+)/sheets/(\d+):copyTo", path
+                )
+            ):
+                self.count("sheets.copyTo")
+                response = spreadsheets.copy_to(match[1], int(match[2]), payload)
+            elif method == "POST" and (
+                match := re.fullmatch(r"/v4/spreadsheets/([^/]+):batchUpdate", path)
+            ):
+                self.count("spreadsheets.batchUpdate")
+                response = spreadsheets.batch_update(match[1], payload)
+            else:
+                raise ApiError(404, f"Unknown method: {method} {path}")
+        except ApiError as e:
+            return e.status, e.body()
+        return 200, response
+
+    def batch(self, content_type: str, body: bytes) -> tuple[str, bytes]:
+        """
+        Answers a multipart/mixed batch, one part per call.
+
+        Args:
+            content_type (str): The batch's Content-Type, with its boundary.
+            body (bytes): The batch body.
+
+        Returns:
+            tuple[str, bytes]: The Content-Type and body of the response.
+        """
+        message = BytesParser().parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        boundary = "batch_response_boundary"
+        response = []
+        for part in message.get_payload():
+            content_id = " ".join(part["Content-ID"].split())
+            request = part.get_payload()
+            if isinstance(request, list):
+                request = request[0].as_string()
+            head, _, request_body = request.replace("\r\n", "\n").partition("\n\n")
+            method, url, _ = head.split("\n", 1)[0].split(" ", 2)
+            status, payload = self.call(method, url, request_body.encode())
+            response.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id[1:]}\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{json.dumps(payload)}\r\n"
+            )
+        response.append(f"--{boundary}--\r\n")
+        return f"multipart/mixed; boundary={boundary}", "".join(response).encode()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # The headers and body go out in separate writes
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                server.count("connections")
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                server.count("requests")
+                server.count("bytes received", len(self.requestline) + length)
+                if self.command == "POST" and urlsplit(self.path).path == "/batch":
+                    server.count("batch")
+                    content_type, content = server.batch(
+                        self.headers["Content-Type"], body
+                    )
+                    status = 200
+                else:
+                    status, payload = server.call(self.command, self.path, body)
+                    content_type = "application/json; charset=UTF-8"
+                    content = json.dumps(payload).encode()
+                server.count("bytes sent", len(content))
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = _handle
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,104 @@
+"""
+Times a cold start of the autoprog CLI.
+
+    python benchmarks/startup.py [--runs N]
+
+Compares bare interpreter startup with importing `autoprog` and running
+`autoprog.py --help`, each in a fresh process, then times building a Sheets
+service with `build()` against `service.build_service()`, and building a
+request on each kind of service (what every API call pays before it's sent).
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    "python -c pass": [sys.executable, "-c", "pass"],
+    "import autoprog": [sys.executable, "-c", "import autoprog"],
+    "autoprog.py --help": [sys.executable, "autoprog.py", "--help"],
+}
+
+BUILD_SNIPPETS = {
+    "build('sheets', 'v4')": (
+        "import httplib2; from googleapiclient.discovery import build; "
+        "build('sheets', 'v4', http=httplib2.Http())"
+    ),
+    "build_service()": (
+        "import httplib2; from service import build_service; "
+        "build_service(http=httplib2.Http())"
+    ),
+}
+
+# Build the service once, then time constructing one request on it
+REQUEST_SETUP = {
+    "build('sheets', 'v4')": (
+        "import httplib2; from googleapiclient.discovery import build; "
+        "service = build('sheets', 'v4', http=httplib2.Http())"
+    ),
+    "build_service()": (
+        "import httplib2; from service import build_service; "
+        "service = build_service(http=httplib2.Http())"
+    ),
+}
+REQUEST_SNIPPET = "service.spreadsheets().values().get(spreadsheetId='x', range='A1')"
+
+
+def time_process(command: list[str], runs: int) -> list[float]:
+    """Returns the wall time of `runs` fresh runs of `command`, in seconds."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=REPO, check=True, capture_output=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def time_in_process(snippet: str, repeat: int, setup: str = "") -> str:
+    """Runs `snippet` in a fresh process and returns its first and warm timings."""
+    script = (
+        f"{setup}\n"
+        "import time\n"
+        f"start = time.perf_counter(); exec({snippet!r}); "
+        "first = time.perf_counter() - start\n"
+        "start = time.perf_counter()\n"
+        f"for _ in range({repeat}): exec({snippet!r})\n"
+        f"warm = (time.perf_counter() - start) / {repeat}\n"
+        "print(f'{first * 1000:8.1f} ms first, {warm * 1000:6.1f} ms after')\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=REPO,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"Cold start, median of {args.runs} runs:")
+    for name, command in COMMANDS.items():
+        timings = time_process(command, args.runs)
+        print(f"  {name:24} {statistics.median(timings) * 1000:8.1f} ms")
+
+    print("Building a Sheets service:")
+    for name, snippet in BUILD_SNIPPETS.items():
+        print(f"  {name:24} {time_in_process(snippet, args.runs)}")
+
+    print("Building a request on that service:")
+    for name, setup in REQUEST_SETUP.items():
+        print(f"  {name:24} {time_in_process(REQUEST_SNIPPET, args.runs, setup)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Times a full `autoprog.main()` run against the fake Sheets API.
+
+    python benchmarks/throughput.py [--clients 10 100 1000] [--modes ...]
+        [--latency SECONDS] [--rate-limit-rate P] [--error-rate P]
+
+For each roster size and engine (sequential, --workers, --workers with
+--transport pooled, --stream, --batch, --async) the fake server in
+`fake_sheets.py` is seeded with a Data spreadsheet, a template and that
+many client spreadsheets, then `main()` copies the program into all of
+them. Reports wall time, requests, connections opened, bytes in each
+direction, and retries.
+
+The client-side rate limiter is lifted unless --quota is given, so the
+numbers show the cost of the code rather than of the Sheets quotas.
+
+The fake server runs in this process, so its handler threads share the
+GIL with the client. With --latency 0 the wall time is mostly the CPU
+each call costs on either side (building the request, encoding, parsing),
+which threads can't overlap, so the concurrent modes gain little over
+sequential. Use a realistic --latency (default 20 ms) to compare how
+well the modes overlap waiting on the API.
+"""
+
+import argparse
+import contextlib
+from functools import partial
+import io
+import os
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import aiosheets  # noqa: E402
+import autoprog  # noqa: E402
+import programs  # noqa: E402
+from fake_sheets import FakeSheetsServer, FakeSpreadsheets  # noqa: E402
+from ratelimit import LIMITER, QuotaLimiter  # noqa: E402
+from service import build_service  # noqa: E402
+
+TEMPLATE_SPREADSHEET_ID = "benchmark-template"
+TEMPLATE_SHEET_ID = 11
+
+MODES = {
+    "sequential": [],
+    "workers": ["--workers", "16"],
+    "pooled": ["--workers", "16", "--transport", "pooled"],
+    "stream": ["--stream", "--workers", "16"],
+    "batch": ["--batch"],
+    "async": ["--async"],
+}
+
+
+def seed(clients: int) -> FakeSpreadsheets:
+    """Returns the spreadsheets for a run over `clients` clients."""
+    spreadsheets = FakeSpreadsheets()
+
+    spreadsheets.add_spreadsheet(TEMPLATE_SPREADSHEET_ID, "Program Templates")
+    spreadsheets.add_sheet(
+        TEMPLATE_SPREADSHEET_ID,
+        f"{autoprog.PROGRAM_NAME} Template",
+        [["Day", "Exercise", "Sets", "Reps"]]
+        + [[f"Day {day}", "Squat", "5", "5"] for day in range(1, 29)],
+        sheet_id=TEMPLATE_SHEET_ID,
+    )
+
+    roster = [
+        [f"Client {number}", f"benchmark-client-{number}"] for number in range(clients)
+    ]
+    spreadsheets.add_spreadsheet(autoprog.DATA_SPREADSHEET_ID, "Data")
+    spreadsheets.add_sheet(
+        autoprog.DATA_SPREADSHEET_ID,
+        autoprog.DATA_PROGRAMS_RANGE.split("!")[0],
+        [["Program", "Spreadsheet", "Sheet"]]
+        + [[autoprog.PROGRAM_NAME, TEMPLATE_SPREADSHEET_ID, str(TEMPLATE_SHEET_ID)]],
+    )
+    spreadsheets.add_sheet(
+        autoprog.DATA_SPREADSHEET_ID,
+        autoprog.DATA_CLIENTS_RANGE.split("!")[0],
+        [["Client", "Spreadsheet"]] + roster,
+    )
+
+    for client_name, spreadsheet_id in roster:
+        spreadsheets.add_spreadsheet(spreadsheet_id, client_name)
+        spreadsheets.add_sheet(spreadsheet_id, "Info")
+        spreadsheets.add_sheet(spreadsheet_id, f"{autoprog.PROGRAM_NAME} - 01/20")
+    return spreadsheets
+
+
+def run(server: FakeSheetsServer, argv: list[str]) -> tuple[float, str]:
+    """
+    Runs `autoprog.main()` against `server` in a scratch directory.
+
+    Returns:
+        tuple[float, str]: The wall time in seconds and everything it printed.
+    """
+    from google.oauth2.credentials import Credentials
+
+    autoprog.get_creds = lambda: Credentials(token="benchmark")
+    autoprog.build_service = partial(build_service, root_url=server.url)
+    programs.build_service = autoprog.build_service
+    aiosheets.SHEETS_API_URL = f"{server.url}v4"
+    programs._thread_local.__dict__.clear()
+
+    output = io.StringIO()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            with contextlib.redirect_stdout(output):
+                start = time.perf_counter()
+                autoprog.main(argv + ["--no-journal"])
+                elapsed = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+    return elapsed, output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument(
+        "--modes", nargs="+", choices=MODES, default=list(MODES), metavar="MODE"
+    )
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--quota",
+        type=float,
+        metavar="PER_MINUTE",
+        help="throttle reads and writes to this quota, like a real run",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    quota = args.quota or 10**9
+    print(
+        f"{'clients':>7} {'mode':10} {'wall s':>8} {'requests':>8} {'conns':>6} "
+        f"{'KB sent':>8} "
+        f"{'KB recv':>8} {'retries':>7} {'copied':>9}"
+    )
+    for clients in args.clients:
+        for mode in args.modes:
+            LIMITER.buckets = QuotaLimiter(quota, quota).buckets
+            with FakeSheetsServer(
+                seed(clients),
+                latency=args.latency,
+                rate_limit_rate=args.rate_limit_rate,
+                error_rate=args.error_rate,
+                seed=args.seed,
+            ) as server:
+                elapsed, output = run(server, MODES[mode])
+            lines = output.splitlines()
+            retries = sum(line.startswith("Retry ") for line in lines)
+            copied = sum(line.startswith("SUCCESS") for line in lines)
+            stats = server.stats
+            print(
+                f"{clients:>7} {mode:10} {elapsed:8.2f} {stats['requests']:>8} "
+                f"{stats['connections']:>6} "
+                f"{stats['bytes received'] / 1024:8.1f} "
+                f"{stats['bytes sent'] / 1024:8.1f} {retries:>7} "
+                f"{f'{copied}/{clients}':>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+A catalog of the template programs, indexed by program name.
+
+The Programs range doesn't change during a run, so it's read once and kept
+in a small on-disk cache that back-to-back runs can reuse.
+"""
+
+from collections import namedtuple
+import json
+import os
+import time
+from typing import Callable, Optional
+
+# Where the catalog is cached between runs, and how long the cache is trusted
+CACHE_FILE = "template_cache.json"
+CACHE_TTL = 60 * 60  # seconds
+
+Template = namedtuple("Template", ["program_name", "spreadsheet_id", "sheet_id"])
+
+
+class TemplateCatalog:
+    """
+    The template programs, looked up by program name.
+
+    Rows whose Sheet ID isn't a number are reported and left out, so one
+    bad row only loses that program rather than the whole run.
+
+    Args:
+        rows (list[list[str]]): Rows in the shape returned by
+            `autoprog.get_template_programs()`.
+    """
+
+    def __init__(self, rows: list[list[str]]):
+        self._templates = {}
+        for row in rows:
+            if len(row) < 3:
+                continue
+            try:
+                sheet_id = int(row[2])
+            except ValueError:
+                print(
+                    f'SKIPPED: template row for "{row[0]}" has a Sheet ID that '
+                    f"isn't a number: {row[2]!r}"
+                )
+                continue
+            # The first row for a program wins, like the old linear scan did
+            self._templates.setdefault(row[0], Template(row[0], row[1], sheet_id))
+
+    def __contains__(self, program_name: str) -> bool:
+        return program_name in self._templates
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def get(self, program_name: str) -> Optional[Template]:
+        """Returns the template for `program_name`, or None if there isn't one."""
+        return self._templates.get(program_name)
+
+    @classmethod
+    def load(
+        cls,
+        fetch_rows: Callable[[], list[list[str]]],
+        source: str,
+        path: str = CACHE_FILE,
+        ttl: float = CACHE_TTL,
+    ) -> "TemplateCatalog":
+        """
+        Loads the catalog from the cache, calling `fetch_rows` only if it's stale.
+
+        Args:
+            fetch_rows (callable): Reads the template rows from the API.
+            source (str): Identifies where the rows come from, so a cache
+                written for a different spreadsheet or range is ignored.
+            path (str): The cache file.
+            ttl (float): How many seconds a cached catalog stays fresh.
+        """
+        rows = read_cache(source, path, ttl)
+        if rows is None:
+            rows = fetch_rows()
+            write_cache(rows, source, path)
+        return cls(rows)
+
+
+def read_cache(source: str, path: str = CACHE_FILE, ttl: float = CACHE_TTL):
+    """
+    Returns the cached template rows, or None if the cache is missing or stale.
+
+    Args:
+        source (str): Where the rows are expected to come from.
+        path (str): The cache file.
+        ttl (float): How many seconds a cached catalog stays fresh.
+    """
+    try:
+        with open(path) as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+
+    if cache.get("source") != source:
+        return None
+    if time.time() - cache.get("fetched_at", 0) > ttl:
+        return None
+    return cache.get("rows")
+
+
+def write_cache(rows: list[list[str]], source: str, path: str = CACHE_FILE):
+    """
+    Saves the template rows, replacing the cache file in one step.
+
+    Args:
+        rows (list[list[str]]): The template rows.
+        source (str): Where the rows came from.
+        path (str): The cache file.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as cache_file:
+        json.dump(
+            {"source": source, "fetched_at": time.time(), "rows": rows}, cache_file
+        )
+    os.replace(tmp_path, path)
+
+
+def invalidate_cache(path: str = CACHE_FILE):
+    """Deletes the cached catalog so the next run fetches it again."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -1,11 +1,106 @@
+from email.utils import parsedate_to_datetime
+import random
 import time
+from typing import Optional
 from googleapiclient.errors import HttpError
 
+from metrics import ATTEMPT, METRICS
+from ratelimit import LIMITER, request_kind
+
+# Errors worth trying again, anything else (bad request, not found, no
+# permission) will fail the same way every time
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+def execute(request):
+    """
+    Executes a googleapiclient request once the shared rate limiter allows it.
+
+    The call is recorded in `METRICS` whether it succeeds or not.
+
+    Args:
+        request (HttpRequest): The request to send.
+
+    Returns:
+        Any: The decoded response.
+    """
+    kind = request_kind(request.method)
+    LIMITER.acquire(kind)
+
+    # Measure the raw response body on its way to being decoded
+    status, size = None, None
+    postproc = request.postproc
+
+    def measured_postproc(resp, content):
+        nonlocal size
+        size = len(content)
+        return postproc(resp, content)
+
+    request.postproc = measured_postproc
+    start = time.monotonic()
+    try:
+        response = request.execute()
+        status = 200
+    except HttpError as e:
+        status, size = e.status_code, len(e.content or b"")
+        if e.status_code == 429:
+            LIMITER.throttled(kind, retry_after(e))
+        raise
+    finally:
+        METRICS.record(request.methodId, kind, status, time.monotonic() - start, size)
+    LIMITER.succeeded(kind)
+    return response
+
+
+def is_retryable(error: HttpError) -> bool:
+    """Returns True if the request might succeed when sent again."""
+    return error.status_code in RETRYABLE_STATUSES
+
+
+def retry_after(error: HttpError) -> Optional[float]:
+    """
+    Returns the seconds the server asked us to wait, if it sent Retry-After.
+
+    Args:
+        error (HttpError): The error the request failed with.
+    """
+    value = error.resp.get("retry-after") if error.resp is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(error: HttpError, delay: float) -> float:
+    """
+    Returns how long to wait before the next attempt.
+
+    Honours Retry-After, otherwise picks a random point in the upper half of
+    `delay` so that parallel callers don't all retry at the same moment.
+
+    Args:
+        error (HttpError): The error the last attempt failed with.
+        delay (float): The current backoff delay in seconds.
+    """
+    server_delay = retry_after(error)
+    if server_delay is not None:
+        return server_delay
+    return delay / 2 + random.uniform(0, delay / 2)
+
 
 def retry_operation(func, retries=3, delay=2, *args, **kwargs):
     """
     Helper function to retry an operation in case of failure.
 
+    Only rate limiting and server errors are retried, anything else fails
+    straight away.
+
     Args:
         func (callable): The function to retry.
         retries (int): The number of times to retry before failing.
@@ -18,13 +113,55 @@ def retry_operation(func, retries=3, delay=2, *args, **kwargs):
     """
     attempt = 0
     while attempt < retries:
+        token = ATTEMPT.set(attempt + 1)
         try:
             return func(*args, **kwargs)
         except HttpError as e:
+            if not is_retryable(e):
+                print(f"Error {e.status_code}: {e.reason}, not retrying")
+                return None
+            print(f"Retry {attempt + 1}/{retries}: Error {e.status_code}: {e.reason}")
+            attempt += 1
+            if attempt < retries:
+                time.sleep(backoff_delay(e, delay))
+                delay *= 2  # Exponential backoff
+        finally:
+            ATTEMPT.reset(token)
+    print(f"Operation failed after {retries} attempts.")
+    return None
+
+
+async def async_retry_operation(func, retries=3, delay=2, *args, **kwargs):
+    """
+    The coroutine version of `retry_operation()`, with the same retry semantics.
+
+    Args:
+        func (callable): The coroutine function to retry.
+        retries (int): The number of times to retry before failing.
+        delay (int): Delay in seconds between retries.
+        *args: Arguments for the function.
+        **kwargs: Keyword arguments for the function.
+
+    Returns:
+        Any: The return value of the coroutine, or None if it failed.
+    """
+    import asyncio
+
+    attempt = 0
+    while attempt < retries:
+        token = ATTEMPT.set(attempt + 1)
+        try:
+            return await func(*args, **kwargs)
+        except HttpError as e:
+            if not is_retryable(e):
+                print(f"Error {e.status_code}: {e.reason}, not retrying")
+                return None
             print(f"Retry {attempt + 1}/{retries}: Error {e.status_code}: {e.reason}")
             attempt += 1
             if attempt < retries:
-                time.sleep(delay)
+                await asyncio.sleep(backoff_delay(e, delay))
                 delay *= 2  # Exponential backoff
+        finally:
+            ATTEMPT.reset(token)
     print(f"Operation failed after {retries} attempts.")
     return None
@@ -0,0 +1,108 @@
+"""
+A local journal of what each run has done, so an interrupted run can resume.
+
+Every finished step is recorded against (program, month, client spreadsheet
+ID) in a small SQLite file. When the run is started again, clients whose
+program is already rotated are skipped without any API calls, and clients
+that only got as far as the copy reuse the sheet instead of copying again.
+"""
+
+from collections import namedtuple
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+JOURNAL_FILE = "run_journal.sqlite3"
+
+# The steps of a copy, in order
+COPIED = "copied"
+ROTATED = "rotated"
+
+JournalEntry = namedtuple("JournalEntry", ["step", "sheet_id", "title", "recorded_at"])
+
+
+class RunJournal:
+    """
+    An append-only record of finished steps, safe to share between threads.
+
+    Args:
+        path (str): The SQLite file, created if it doesn't exist.
+    """
+
+    def __init__(self, path: str = JOURNAL_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS steps (
+                program TEXT NOT NULL,
+                month TEXT NOT NULL,
+                spreadsheet_id TEXT NOT NULL,
+                step TEXT NOT NULL,
+                sheet_id INTEGER,
+                title TEXT,
+                recorded_at REAL NOT NULL,
+                PRIMARY KEY (program, month, spreadsheet_id, step)
+            )
+            """
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(
+        self,
+        program: str,
+        month: str,
+        spreadsheet_id: str,
+        step: str,
+        sheet_id: Optional[int] = None,
+        title: Optional[str] = None,
+    ):
+        """
+        Records that a step finished for a client.
+
+        Args:
+            program (str): The program name, e.g. "602".
+            month (str): The month of the run, e.g. "10/26".
+            spreadsheet_id (str): The client spreadsheet ID.
+            step (str): `COPIED` or `ROTATED`.
+            sheet_id (int): The sheet the step produced.
+            title (str): The sheet's title after the step.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO steps VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (program, month, spreadsheet_id, step, sheet_id, title, time.time()),
+            )
+
+    def steps(self, program: str, month: str, spreadsheet_id: str) -> dict:
+        """
+        Returns the steps already finished for a client.
+
+        Args:
+            program (str): The program name.
+            month (str): The month of the run.
+            spreadsheet_id (str): The client spreadsheet ID.
+
+        Returns:
+            dict[str, JournalEntry]: The entries keyed by step.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT step, sheet_id, title, recorded_at FROM steps "
+                "WHERE program = ? AND month = ? AND spreadsheet_id = ?",
+                (program, month, spreadsheet_id),
+            ).fetchall()
+        return {row[0]: JournalEntry(*row) for row in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
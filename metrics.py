@@ -0,0 +1,216 @@
+"""
+Records every Sheets API call a run makes, and summarizes them at the end.
+
+Each call is recorded with its method, latency, response size, status,
+attempt number and the client it was made for. With `--metrics-log` the
+calls are also written out as JSON lines while the run goes. The summary
+shows p50/p95/p99 latency per endpoint, the quota used in each minute of
+the run and how long each client took, so a slow run can be pinned on the
+step (copyTo, the index GET or the rotate batchUpdate) that caused it.
+"""
+
+from collections import defaultdict, namedtuple
+from contextvars import ContextVar
+import json
+import math
+import statistics
+import threading
+import time
+from typing import Optional
+
+from ratelimit import READ, WRITE
+
+# The client the current thread or task is copying to, set by `copy()`
+CURRENT_CLIENT: ContextVar[Optional[str]] = ContextVar("current_client", default=None)
+
+# Which attempt the call being made is, set by the retry helpers
+ATTEMPT: ContextVar[int] = ContextVar("attempt", default=1)
+
+# How many clients the summary lists by name
+SLOWEST_CLIENTS = 10
+
+CallRecord = namedtuple(
+    "CallRecord",
+    [
+        "method_id",
+        "kind",
+        "status",
+        "latency",
+        "size",
+        "attempt",
+        "client",
+        "started_at",
+    ],
+)
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """
+    Returns the nearest-rank percentile of `values`.
+
+    Args:
+        values (list[float]): The samples, in any order.
+        percent (float): The percentile, e.g. 95.
+    """
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class RunMetrics:
+    """
+    The calls made during a run, safe to share between threads and tasks.
+    """
+
+    def __init__(self):
+        self._calls: list[CallRecord] = []
+        self._log = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self, log_path: Optional[str] = None) -> "RunMetrics":
+        """
+        Forgets earlier calls and starts recording a new run.
+
+        Args:
+            log_path (str): If given, every call is appended to this file as
+                a line of JSON.
+
+        Returns:
+            RunMetrics: Itself, to use as a context manager that calls `stop()`.
+        """
+        with self._lock:
+            self._calls = []
+            if log_path:
+                self._log = open(log_path, "a")
+        return self
+
+    def stop(self):
+        """Closes the JSON log, if there is one."""
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    def record(
+        self,
+        method_id: str,
+        kind: str,
+        status: Optional[int],
+        latency: float,
+        size: Optional[int] = None,
+        client: Optional[str] = None,
+        attempt: Optional[int] = None,
+    ):
+        """
+        Records one finished call.
+
+        Args:
+            method_id (str): The API method, e.g. "sheets.spreadsheets.get".
+            kind (str): `READ` or `WRITE`, the quota it counts against.
+            status (int): The HTTP status, or None if no response came back.
+            latency (float): Seconds from sending the call to its response.
+            size (int): The size of the response body in bytes, if known.
+            client (str): The client spreadsheet ID, `CURRENT_CLIENT` if not given.
+            attempt (int): Which attempt this was, `ATTEMPT` if not given.
+        """
+        call = CallRecord(
+            method_id,
+            kind,
+            status,
+            latency,
+            size,
+            attempt if attempt is not None else ATTEMPT.get(),
+            client if client is not None else CURRENT_CLIENT.get(),
+            time.time() - latency,
+        )
+        with self._lock:
+            self._calls.append(call)
+            if self._log is not None:
+                self._log.write(json.dumps(call._asdict()) + "\n")
+                self._log.flush()
+
+    def extend(self, calls: list[CallRecord]):
+        """
+        Adds calls recorded somewhere else, e.g. by another process.
+
+        Args:
+            calls (list[CallRecord]): The calls.
+        """
+        with self._lock:
+            self._calls.extend(calls)
+            if self._log is not None:
+                for call in calls:
+                    self._log.write(json.dumps(call._asdict()) + "\n")
+                self._log.flush()
+
+    def calls(self) -> list[CallRecord]:
+        """Returns the calls recorded so far."""
+        with self._lock:
+            return list(self._calls)
+
+    def print_summary(self):
+        """Prints latency per endpoint, quota use per minute and time per client."""
+        calls = self.calls()
+        if not calls:
+            return
+
+        first = min(call.started_at for call in calls)
+        last = max(call.started_at + call.latency for call in calls)
+        received = sum(call.size or 0 for call in calls)
+        retried = sum(call.attempt > 1 for call in calls)
+        print(
+            f"Sheets API: {len(calls)} calls in {last - first:.1f} s, "
+            f"{received / 1024:.1f} KB received, {retried} retries"
+        )
+
+        by_method = defaultdict(list)
+        for call in calls:
+            by_method[call.method_id].append(call)
+        print(
+            f"  {'endpoint':40} {'calls':>6} {'errors':>6} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+        )
+        for method_id, method_calls in sorted(by_method.items()):
+            latencies = [call.latency * 1000 for call in method_calls]
+            errors = sum(call.status != 200 for call in method_calls)
+            print(
+                f"  {method_id:40} {len(method_calls):>6} {errors:>6} "
+                f"{percentile(latencies, 50):8.1f} {percentile(latencies, 95):8.1f} "
+                f"{percentile(latencies, 99):8.1f}"
+            )
+
+        per_minute = defaultdict(lambda: {READ: 0, WRITE: 0})
+        for call in calls:
+            per_minute[int((call.started_at - first) // 60)][call.kind] += 1
+        print("  Quota used per minute:")
+        for minute, used in sorted(per_minute.items()):
+            print(f"    minute {minute + 1}: {used[READ]} reads, {used[WRITE]} writes")
+
+        spans = {}
+        for call in calls:
+            if call.client is None:
+                continue
+            start, end = spans.get(call.client, (math.inf, 0))
+            spans[call.client] = (
+                min(start, call.started_at),
+                max(end, call.started_at + call.latency),
+            )
+        if spans:
+            elapsed = {client: end - start for client, (start, end) in spans.items()}
+            print(
+                f"  Time per client: median {statistics.median(elapsed.values()):.2f} s, "
+                f"max {max(elapsed.values()):.2f} s over {len(elapsed)} clients"
+            )
+            slowest = sorted(elapsed.items(), key=lambda item: item[1], reverse=True)
+            for client, seconds in slowest[:SLOWEST_CLIENTS]:
+                print(f"    {client}: {seconds:.2f} s")
+
+
+# The metrics every call in the process is recorded in
+METRICS = RunMetrics()
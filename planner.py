@@ -0,0 +1,106 @@
+"""
+Plans a run before anything is copied.
+
+The plan says, for every client, which template will be copied, what the
+new sheet will be called and which operations are left to do. It can be
+printed or exported with `--dry-run`, and the same plan is what the
+executor works through.
+"""
+
+from collections import namedtuple
+import json
+from typing import Optional
+
+from catalog import Template
+from journal import COPIED, ROTATED, RunJournal
+
+# Everything a client normally needs, in order
+COPY_OPERATIONS = ("copyTo", "rename", "move to front", "hide previous program")
+
+# What's left once the journal says the sheet was copied
+ROTATE_OPERATIONS = COPY_OPERATIONS[1:]
+
+PlannedCopy = namedtuple(
+    "PlannedCopy", ["client", "template", "target_title", "operations"]
+)
+Plan = namedtuple("Plan", ["program_name", "month", "template", "copies"])
+
+
+def make_plan(
+    program_name: str,
+    month: str,
+    target_title: str,
+    template: Template,
+    clients: list,
+    journal: Optional[RunJournal] = None,
+) -> Plan:
+    """
+    Works out what a run will do for each client, without any API calls.
+
+    Args:
+        program_name (str): The name of the program.
+        month (str): The month of the run, e.g. "10/26".
+        target_title (str): What the new sheets will be called.
+        template (Template): The template the program is copied from.
+        clients (list[Client]): The clients to copy to.
+        journal (RunJournal): If given, steps an earlier run finished are
+            left out of the plan.
+    """
+    copies = []
+    for client in clients:
+        operations = COPY_OPERATIONS
+        if journal is not None:
+            done = journal.steps(program_name, month, client.spreadsheet_id)
+            if ROTATED in done:
+                operations = ()
+            elif COPIED in done:
+                operations = ROTATE_OPERATIONS
+        copies.append(PlannedCopy(client, template, target_title, operations))
+    return Plan(program_name, month, template, tuple(copies))
+
+
+def print_plan(plan: Plan):
+    """Prints the plan, one line per client."""
+    template = plan.template
+    print(
+        f'Plan: copy "{plan.program_name}" from sheet {template.sheet_id} of '
+        f"{template.spreadsheet_id} for {plan.month}"
+    )
+    for planned in plan.copies:
+        client = planned.client
+        if planned.operations:
+            steps = ", ".join(planned.operations)
+            print(f'  {client.client_name}: "{planned.target_title}" ({steps})')
+        else:
+            print(f"  {client.client_name}: already done")
+    remaining = sum(1 for planned in plan.copies if planned.operations)
+    print(f"{remaining}/{len(plan.copies)} clients to copy")
+
+
+def export_plan(plan: Plan, path: str):
+    """
+    Writes the plan as JSON.
+
+    Args:
+        plan (Plan): The plan.
+        path (str): The file to write.
+    """
+    with open(path, "w") as plan_file:
+        json.dump(
+            {
+                "program_name": plan.program_name,
+                "month": plan.month,
+                "template": plan.template._asdict(),
+                "copies": [
+                    {
+                        "client_name": planned.client.client_name,
+                        "spreadsheet_id": planned.client.spreadsheet_id,
+                        "target_title": planned.target_title,
+                        "operations": list(planned.operations),
+                    }
+                    for planned in plan.copies
+                ],
+            },
+            plan_file,
+            indent=2,
+        )
@@ -0,0 +1,614 @@
+"""
+Copying a program into client spreadsheets, once the run has a plan.
+
+`autoprog.py` is the script, so nothing imports it: running it would
+otherwise load it twice, once as `__main__` and once as `autoprog`, each
+with its own classes and per-thread services. It reads the roster and
+makes the plan. This module carries the plan out (`execute_plan()`), so
+the shards of `sharding.py` can too. What to do for each client is
+decided once (`copy_steps()`), and the threaded engine here and the async
+one in `aiosheets.py` only differ in how they make the API calls.
+"""
+
+from __future__ import annotations
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+import threading
+from typing import TYPE_CHECKING, Callable, Generator, Optional, Union
+
+from helpers import execute, retry_operation
+from journal import COPIED, ROTATED
+from metrics import CURRENT_CLIENT
+from service import build_service
+from sheet_index import SHEET_INDEX_FIELDS, SheetIndex
+
+if TYPE_CHECKING:
+    from googleapiclient.discovery import Resource
+
+    from batching import UpdateBatcher, UpdateCallback
+    from catalog import Template
+    from journal import RunJournal
+    from planner import Plan, PlannedCopy
+    from transport import Transport
+
+# The outcome of copying the program into one client spreadsheet
+CopyResult = namedtuple("CopyResult", ["spreadsheet_id", "ok", "message"])
+
+# The API calls `copy_steps()` asks its engine to make in the client spreadsheet
+ReadIndex = namedtuple("ReadIndex", [])
+CopySheet = namedtuple("CopySheet", ["source_spreadsheet", "source_sheet"])
+RotateSheet = namedtuple("RotateSheet", ["sheet_id", "new_title", "index"])
+
+# Each worker thread keeps its own service, httplib2 can't be shared across threads
+_thread_local = threading.local()
+
+
+def current_month() -> str:
+    """Returns the month programs are copied for, e.g. 10/26"""
+    return datetime.now().strftime("%m/%y")
+
+
+def new_program_title(program_name: str, month: str) -> str:
+    """Returns the title a program gets in `month`, e.g. 602 - 10/26"""
+    return f"{program_name} - {month}"
+
+
+def get_sheet_index(service: Resource, spreadsheet_id: str) -> SheetIndex:
+    """
+    Reads just the sheet IDs and titles of a spreadsheet.
+
+    Args:
+        service (Resource): The Google API service object.
+        spreadsheet_id (str): The spreadsheet ID.
+    """
+    spreadsheet = execute(
+        service.spreadsheets().get(
+            spreadsheetId=spreadsheet_id, fields=SHEET_INDEX_FIELDS
+        )
+    )
+    return SheetIndex.from_response(spreadsheet_id, spreadsheet)
+
+
+def rotate_requests(sheet_id: int, new_title: str, previous_sheet_id: Optional[int]):
+    """
+    Returns the batchUpdate requests that put a new program in front.
+
+    Args:
+        sheet_id (int): The new program's sheet ID.
+        new_title (str): The title for the new program.
+        previous_sheet_id (int): The sheet to hide, if any.
+    """
+    requests = [
+        {
+            "updateSheetProperties": {
+                "properties": {
+                    "sheetId": sheet_id,
+                    "title": new_title,
+                    "index": 0,
+                },
+                "fields": "title,index",
+            }
+        }
+    ]
+    if previous_sheet_id is not None:
+        requests.append(
+            {
+                "updateSheetProperties": {
+                    "properties": {
+                        "sheetId": previous_sheet_id,
+                        "hidden": True,
+                    },
+                    "fields": "hidden",
+                }
+            }
+        )
+    return requests
+
+
+def get_thread_service(transport: Transport) -> Resource:
+    """
+    Return the Sheets service owned by the calling thread, building it on first use.
+
+    Args:
+        transport (Transport): The transport shared by every worker.
+    """
+    if not hasattr(_thread_local, "service"):
+        _thread_local.service = build_service(http=transport.http())
+    return _thread_local.service
+
+
+def copy_steps(
+    program_name: str,
+    month: str,
+    new_title: str,
+    template: Optional[Template],
+    destination_spreadsheet_id: str,
+    journal: Optional[RunJournal] = None,
+) -> Generator[Union[ReadIndex, CopySheet, RotateSheet], object, CopyResult]:
+    """
+    Decides how to copy the program into one client, one API call at a time.
+
+    Yields a `ReadIndex`, `CopySheet` or `RotateSheet` for each call it needs.
+    The engine running it makes the call, with retries, and sends back what
+    it returned: the `SheetIndex`, the new sheet's properties or the title
+    the sheet ended up with, or None if the call failed. `resume()` does the
+    sending. Clients that already have this month's program are skipped, so
+    running again after a failure never makes duplicates.
+
+    Args:
+        program_name (str): The name of the program.
+        month (str): The month of the run, e.g. "10/26".
+        new_title (str): What the new sheet should be called.
+        template (Template): The template to copy, None if there isn't one.
+        destination_spreadsheet_id (str): The destination spreadsheet ID.
+        journal (RunJournal): Records each finished step, and lets a rerun
+            skip clients it already finished without any API calls.
+
+    Returns:
+        CopyResult: Whether the copy worked, with a SUCCESS/ERROR message.
+    """
+
+    def failed(message: str) -> CopyResult:
+        return CopyResult(destination_spreadsheet_id, False, f"ERROR: {message}")
+
+    def skipped(title: str, spreadsheet: str) -> CopyResult:
+        return CopyResult(
+            destination_spreadsheet_id,
+            True,
+            f'SKIPPED: "{title}" sheet is already in {spreadsheet}',
+        )
+
+    def record(step: str, sheet_id: int, title: str):
+        if journal is not None:
+            journal.record(
+                program_name, month, destination_spreadsheet_id, step, sheet_id, title
+            )
+
+    done = {}
+    if journal is not None:
+        done = journal.steps(program_name, month, destination_spreadsheet_id)
+    if ROTATED in done:
+        return skipped(done[ROTATED].title, destination_spreadsheet_id)
+
+    if not template:
+        return failed(f"could not find template for {program_name}")
+
+    # Find out which sheet titles are already taken
+    index = yield ReadIndex()
+    if not index:
+        return failed(f"could not read the sheets in {destination_spreadsheet_id}")
+
+    # Don't copy again if an earlier run got this far without recording it
+    existing_sheet = index.sheet_id(new_title)
+    if existing_sheet is not None:
+        record(ROTATED, existing_sheet, new_title)
+        return skipped(new_title, index.spreadsheet_title)
+
+    # Copy the sheet, unless an interrupted run already did
+    if COPIED in done and index.has_sheet(done[COPIED].sheet_id):
+        destination_sheet = done[COPIED].sheet_id
+    else:
+        copied_sheet = yield CopySheet(template.spreadsheet_id, template.sheet_id)
+        if not copied_sheet:
+            return failed(
+                f'could not copy "{program_name}" to {destination_spreadsheet_id}'
+            )
+        destination_sheet = copied_sheet["sheetId"]
+        index.add_sheet(copied_sheet)
+        record(COPIED, destination_sheet, copied_sheet["title"])
+
+    # Rename the sheet, hide last month's program and put the new one first
+    renamed_title = yield RotateSheet(destination_sheet, new_title, index)
+    if not renamed_title:
+        return failed(f'failed to copy and rename sheet "{new_title}"')
+
+    record(ROTATED, destination_sheet, renamed_title)
+    return CopyResult(
+        destination_spreadsheet_id,
+        True,
+        f'SUCCESS: copied "{renamed_title}" sheet to {index.spreadsheet_title}',
+    )
+
+
+def resume(steps: Generator, answer=None):
+    """
+    Sends the answer to the call a `copy_steps()` generator is waiting on.
+
+    Args:
+        steps (Generator): The generator from `copy_steps()`.
+        answer: What the call returned, None to start the generator.
+
+    Returns:
+        The next step to carry out, or the CopyResult once the copy is done.
+    """
+    try:
+        return steps.send(answer)
+    except StopIteration as finished:
+        return finished.value
+
+
+def spreadsheets_sheets_copyto(
+    service: Resource,
+    source_spreadsheet: str,
+    source_sheet: int,
+    destination: str,
+) -> dict:
+    """
+    Copies the sheet from one spreadsheet to another.
+
+    Args:
+        service (Resource): The Google API service object.
+        program_name (str): The name of the program.
+        source_spreadsheet (str): The source spreadsheet ID.
+        source_sheet (int): The source sheet ID.
+        destination (str): The destination spreadsheet ID.
+
+    Returns:
+        dict: The properties of the newly created sheet in the following form:
+
+        { # Properties of a sheet.
+            "dataSourceSheetProperties": { # Additional properties of a DATA_SOURCE sheet. # Output only. If present, the field contains DATA_SOURCE sheet specific properties.
+                "columns": [ # The columns displayed on the sheet, corresponding to the values in RowData.
+                { # A column in a data source.
+                    "formula": "A String", # The formula of the calculated column.
+                    "reference": { # An unique identifier that references a data source column. # The column reference.
+                    "name": "A String", # The display name of the column. It should be unique within a data source.
+                    },
+                },
+                ],
+                "dataExecutionStatus": { # The data execution status. A data execution is created to sync a data source object with the latest data from a DataSource. It is usually scheduled to run at background, you can check its state to tell if an execution completes There are several scenarios where a data execution is triggered to run: * Adding a data source creates an associated data source sheet as well as a data execution to sync the data from the data source to the sheet. * Updating a data source creates a data execution to refresh the associated data source sheet similarly. * You can send refresh request to explicitly refresh one or multiple data source objects. # The data execution status.
+                "errorCode": "A String", # The error code.
+                "errorMessage": "A String", # The error message, which may be empty.
+                "lastRefreshTime": "A String", # Gets the time the data last successfully refreshed.
+                "state": "A String", # The state of the data execution.
+                },
+                "dataSourceId": "A String", # ID of the DataSource the sheet is connected to.
+            },
+            "gridProperties": { # Properties of a grid. # Additional properties of the sheet if this sheet is a grid. (If the sheet is an object sheet, containing a chart or image, then this field will be absent.) When writing it is an error to set any grid properties on non-grid sheets. If this sheet is a DATA_SOURCE sheet, this field is output only but contains the properties that reflect how a data source sheet is rendered in the UI, e.g. row_count.
+                "columnCount": 42, # The number of columns in the grid.
+                "columnGroupControlAfter": True or False, # True if the column grouping control toggle is shown after the group.
+                "frozenColumnCount": 42, # The number of columns that are frozen in the grid.
+                "frozenRowCount": 42, # The number of rows that are frozen in the grid.
+                "hideGridlines": True or False, # True if the grid isn't showing gridlines in the UI.
+                "rowCount": 42, # The number of rows in the grid.
+                "rowGroupControlAfter": True or False, # True if the row grouping control toggle is shown after the group.
+            },
+            "hidden": True or False, # True if the sheet is hidden in the UI, false if it's visible.
+            "index": 42, # The index of the sheet within the spreadsheet. When adding or updating sheet properties, if this field is excluded then the sheet is added or moved to the end of the sheet list. When updating sheet indices or inserting sheets, movement is considered in "before the move" indexes. For example, if there were three sheets (S1, S2, S3) in order to move S1 ahead of S2 the index would have to be set to 2. A sheet index update request is ignored if the requested index is identical to the sheets current index or if the requested new index is equal to the current sheet index + 1.
+            "rightToLeft": True or False, # True if the sheet is an RTL sheet instead of an LTR sheet.
+            "sheetId": 42, # The ID of the sheet. Must be non-negative. This field cannot be changed once set.
+            "sheetType": "A String", # The type of sheet. Defaults to GRID. This field cannot be changed once set.
+            "tabColor": { # Represents a color in the RGBA color space. This representation is designed for simplicity of conversion to and from color representations in various languages over compactness. For example, the fields of this representation can be trivially provided to the constructor of `java.awt.Color` in Java; it can also be trivially provided to UIColor's `+colorWithRed:green:blue:alpha` method in iOS; and, with just a little work, it can be easily formatted into a CSS `rgba()` string in JavaScript. This reference page doesn't have information about the absolute color space that should be used to interpret the RGB value—for example, sRGB, Adobe RGB, DCI-P3, and BT.2020. By default, applications should assume the sRGB color space. When color equality needs to be decided, implementations, unless documented otherwise, treat two colors as equal if all their red, green, blue, and alpha values each differ by at most `1e-5`. Example (Java): import com.google.type.Color; // ... public static java.awt.Color fromProto(Color protocolor) { float alpha = protocolor.hasAlpha() ? protocolor.getAlpha().getValue() : 1.0; return new java.awt.Color( protocolor.getRed(), protocolor.getGreen(), protocolor.getBlue(), alpha); } public static Color toProto(java.awt.Color color) { float red = (float) color.getRed(); float green = (float) color.getGreen(); float blue = (float) color.getBlue(); float denominator = 255.0; Color.Builder resultBuilder = Color .newBuilder() .setRed(red / denominator) .setGreen(green / denominator) .setBlue(blue / denominator); int alpha = color.getAlpha(); if (alpha != 255) { result.setAlpha( FloatValue .newBuilder() .setValue(((float) alpha) / denominator) .build()); } return resultBuilder.build(); } // ... Example (iOS / Obj-C): // ... static UIColor* fromProto(Color* protocolor) { float red = [protocolor red]; float green = [protocolor green]; float blue = [protocolor blue]; FloatValue* alpha_wrapper = [protocolor alpha]; float alpha = 1.0; if (alpha_wrapper != nil) { alpha = [alpha_wrapper value]; } return [UIColor colorWithRed:red green:green blue:blue alpha:alpha]; } static Color* toProto(UIColor* color) { CGFloat red, green, blue, alpha; if (![color getRed:&red green:&green blue:&blue alpha:&alpha]) { return nil; } Color* result = [[Color alloc] init]; [result setRed:red]; [result setGreen:green]; [result setBlue:blue]; if (alpha <= 0.9999) { [result setAlpha:floatWrapperWithValue(alpha)]; } [result autorelease]; return result; } // ... Example (JavaScript): // ... var protoToCssColor = function(rgb_color) { var redFrac = rgb_color.red || 0.0; var greenFrac = rgb_color.green || 0.0; var blueFrac = rgb_color.blue || 0.0; var red = Math.floor(redFrac * 255); var green = Math.floor(greenFrac * 255); var blue = Math.floor(blueFrac * 255); if (!('alpha' in rgb_color)) { return rgbToCssColor(red, green, blue); } var alphaFrac = rgb_color.alpha.value || 0.0; var rgbParams = [red, green, blue].join(','); return ['rgba(', rgbParams, ',', alphaFrac, ')'].join(''); }; var rgbToCssColor = function(red, green, blue) { var rgbNumber = new Number((red << 16) | (green << 8) | blue); var hexString = rgbNumber.toString(16); var missingZeros = 6 - hexString.length; var resultBuilder = ['#']; for (var i = 0; i < missingZeros; i++) { resultBuilder.push('0'); } resultBuilder.push(hexString); return resultBuilder.join(''); }; // ... # The color of the tab in the UI. Deprecated: Use tab_color_style.
+                "alpha": 3.14, # The fraction of this color that should be applied to the pixel. That is, the final pixel color is defined by the equation: `pixel color = alpha * (this color) + (1.0 - alpha) * (background color)` This means that a value of 1.0 corresponds to a solid color, whereas a value of 0.0 corresponds to a completely transparent color. This uses a wrapper message rather than a simple float scalar so that it is possible to distinguish between a default value and the value being unset. If omitted, this color object is rendered as a solid color (as if the alpha value had been explicitly given a value of 1.0).
+                "blue": 3.14, # The amount of blue in the color as a value in the interval [0, 1].
+                "green": 3.14, # The amount of green in the color as a value in the interval [0, 1].
+                "red": 3.14, # The amount of red in the color as a value in the interval [0, 1].
+            },
+            "tabColorStyle": { # A color value. # The color of the tab in the UI. If tab_color is also set, this field takes precedence.
+                "rgbColor": { # Represents a color in the RGBA color space. This representation is designed for simplicity of conversion to and from color representations in various languages over compactness. For example, the fields of this representation can be trivially provided to the constructor of `java.awt.Color` in Java; it can also be trivially provided to UIColor's `+colorWithRed:green:blue:alpha` method in iOS; and, with just a little work, it can be easily formatted into a CSS `rgba()` string in JavaScript. This reference page doesn't have information about the absolute color space that should be used to interpret the RGB value—for example, sRGB, Adobe RGB, DCI-P3, and BT.2020. By default, applications should assume the sRGB color space. When color equality needs to be decided, implementations, unless documented otherwise, treat two colors as equal if all their red, green, blue, and alpha values each differ by at most `1e-5`. Example (Java): import com.google.type.Color; // ... public static java.awt.Color fromProto(Color protocolor) { float alpha = protocolor.hasAlpha() ? protocolor.getAlpha().getValue() : 1.0; return new java.awt.Color( protocolor.getRed(), protocolor.getGreen(), protocolor.getBlue(), alpha); } public static Color toProto(java.awt.Color color) { float red = (float) color.getRed(); float green = (float) color.getGreen(); float blue = (float) color.getBlue(); float denominator = 255.0; Color.Builder resultBuilder = Color .newBuilder() .setRed(red / denominator) .setGreen(green / denominator) .setBlue(blue / denominator); int alpha = color.getAlpha(); if (alpha != 255) { result.setAlpha( FloatValue .newBuilder() .setValue(((float) alpha) / denominator) .build()); } return resultBuilder.build(); } // ... Example (iOS / Obj-C): // ... static UIColor* fromProto(Color* protocolor) { float red = [protocolor red]; float green = [protocolor green]; float blue = [protocolor blue]; FloatValue* alpha_wrapper = [protocolor alpha]; float alpha = 1.0; if (alpha_wrapper != nil) { alpha = [alpha_wrapper value]; } return [UIColor colorWithRed:red green:green blue:blue alpha:alpha]; } static Color* toProto(UIColor* color) { CGFloat red, green, blue, alpha; if (![color getRed:&red green:&green blue:&blue alpha:&alpha]) { return nil; } Color* result = [[Color alloc] init]; [result setRed:red]; [result setGreen:green]; [result setBlue:blue]; if (alpha <= 0.9999) { [result setAlpha:floatWrapperWithValue(alpha)]; } [result autorelease]; return result; } // ... Example (JavaScript): // ... var protoToCssColor = function(rgb_color) { var redFrac = rgb_color.red || 0.0; var greenFrac = rgb_color.green || 0.0; var blueFrac = rgb_color.blue || 0.0; var red = Math.floor(redFrac * 255); var green = Math.floor(greenFrac * 255); var blue = Math.floor(blueFrac * 255); if (!('alpha' in rgb_color)) { return rgbToCssColor(red, green, blue); } var alphaFrac = rgb_color.alpha.value || 0.0; var rgbParams = [red, green, blue].join(','); return ['rgba(', rgbParams, ',', alphaFrac, ')'].join(''); }; var rgbToCssColor = function(red, green, blue) { var rgbNumber = new Number((red << 16) | (green << 8) | blue); var hexString = rgbNumber.toString(16); var missingZeros = 6 - hexString.length; var resultBuilder = ['#']; for (var i = 0; i < missingZeros; i++) { resultBuilder.push('0'); } resultBuilder.push(hexString); return resultBuilder.join(''); }; // ... # RGB color. The [`alpha`](/sheets/api/reference/rest/v4/spreadsheets/other#Color.FIELDS.alpha) value in the [`Color`](/sheets/api/reference/rest/v4/spreadsheets/other#color) object isn't generally supported.
+                "alpha": 3.14, # The fraction of this color that should be applied to the pixel. That is, the final pixel color is defined by the equation: `pixel color = alpha * (this color) + (1.0 - alpha) * (background color)` This means that a value of 1.0 corresponds to a solid color, whereas a value of 0.0 corresponds to a completely transparent color. This uses a wrapper message rather than a simple float scalar so that it is possible to distinguish between a default value and the value being unset. If omitted, this color object is rendered as a solid color (as if the alpha value had been explicitly given a value of 1.0).
+                "blue": 3.14, # The amount of blue in the color as a value in the interval [0, 1].
+                "green": 3.14, # The amount of green in the color as a value in the interval [0, 1].
+                "red": 3.14, # The amount of red in the color as a value in the interval [0, 1].
+                },
+                "themeColor": "A String", # Theme color.
+            },
+            "title": "A String", # The name of the sheet.
+            }
+
+    Links:
+        - https://developers.google.com/sheets/api/reference/rest/v4/spreadsheets.sheets/copyTo
+        - https://googleapis.github.io/google-api-python-client/docs/dyn/sheets_v4.spreadsheets.sheets.html
+    """
+    return execute(
+        service.spreadsheets()
+        .sheets()
+        .copyTo(
+            spreadsheetId=source_spreadsheet,
+            sheetId=source_sheet,
+            body={"destination_spreadsheet_id": destination},
+        )
+    )
+
+
+def rotate_program(
+    service: Resource,
+    spreadsheet_id: str,
+    sheet_id: int,
+    new_title: str,
+    index: Optional[SheetIndex] = None,
+    batcher: Optional[UpdateBatcher] = None,
+    callback: Optional[UpdateCallback] = None,
+) -> str:
+    """
+    Renames the new program, hides the previous one and moves the new one
+    to the front, all in one batchUpdate.
+
+    Args:
+        service (Resource): The Google API service object.
+        spreadsheet_id (str): The spreadsheet ID.
+        sheet_id (int): The sheet ID of the newly copied program.
+        new_title (str): The desired new title for the sheet.
+        index (SheetIndex): The spreadsheet's sheets, read with
+            `get_sheet_index()` if not given. Updated once the batchUpdate
+            has gone through.
+        batcher (UpdateBatcher): If given, the requests are queued on it
+            instead of being sent straight away.
+        callback (callable): With `batcher`, called with the response or the
+            error once the queued requests have been sent.
+
+    Returns:
+        str: The title the sheet ended up with.
+    """
+    if index is None:
+        index = get_sheet_index(service, spreadsheet_id)
+    new_title = index.unique_title(new_title)
+    previous_sheet_id = index.previous_program(new_title)
+    requests = rotate_requests(sheet_id, new_title, previous_sheet_id)
+
+    def rotated():
+        index.set_title(sheet_id, new_title)
+        index.move(sheet_id, 0)
+        if previous_sheet_id is not None:
+            index.hide(previous_sheet_id)
+
+    if batcher is not None:
+        old_title = index.title(sheet_id)
+
+        def sent(response: Optional[dict], error: Optional[Exception]):
+            if error is None:
+                rotated()
+            else:
+                index.set_title(sheet_id, old_title)
+            if callback is not None:
+                callback(response, error)
+
+        # Claim the title now so nothing else queued for this spreadsheet takes it
+        index.set_title(sheet_id, new_title)
+        batcher.add(spreadsheet_id, requests, sent)
+        return new_title
+
+    execute(
+        service.spreadsheets().batchUpdate(
+            spreadsheetId=spreadsheet_id,
+            body={"requests": requests, "includeSpreadsheetInResponse": False},
+            fields="spreadsheetId",
+        )
+    )
+    rotated()
+    return new_title
+
+
+def copy(
+    service: Resource,
+    plan: Plan,
+    planned: PlannedCopy,
+    batcher: Optional[UpdateBatcher] = None,
+    report: Optional[Callable[[CopyResult], None]] = None,
+    journal: Optional[RunJournal] = None,
+) -> Optional[CopyResult]:
+    """
+    Copy one sheet to a different spreadsheet
+
+    Makes the API calls `copy_steps()` asks for, each with retries. The
+    month, template and title are the plan's, so the run does what the plan
+    printed even if the month turns while it runs.
+
+    Args:
+        service (Resource): The Google API service object.
+        plan (Plan): The plan from `make_plan()`.
+        planned (PlannedCopy): The client to copy to, from the plan.
+        batcher (UpdateBatcher): If given, the rename/hide is queued on it and
+            the result is passed to `report` once the batch has been sent.
+        report (callable): With `batcher`, receives the result of the copy.
+        journal (RunJournal): Records each finished step, and lets a rerun
+            skip clients it already finished without any API calls.
+
+    Returns:
+        CopyResult: Whether the copy worked, with a SUCCESS/ERROR message.
+            None if the rename was queued on `batcher`.
+    """
+    destination_spreadsheet_id = planned.client.spreadsheet_id
+    # Calls made from here on are counted against this client
+    CURRENT_CLIENT.set(destination_spreadsheet_id)
+
+    steps = copy_steps(
+        plan.program_name,
+        plan.month,
+        planned.target_title,
+        planned.template,
+        destination_spreadsheet_id,
+        journal,
+    )
+    step = resume(steps)
+    while not isinstance(step, CopyResult):
+        if isinstance(step, ReadIndex):
+            answer = retry_operation(
+                get_sheet_index, 3, 2, service, destination_spreadsheet_id
+            )
+        elif isinstance(step, CopySheet):
+            answer = retry_operation(
+                spreadsheets_sheets_copyto,
+                3,
+                2,
+                service,
+                step.source_spreadsheet,
+                step.source_sheet,
+                destination_spreadsheet_id,
+            )
+        elif batcher is not None:
+            rotate = step
+
+            def rotated(response: Optional[dict], error: Optional[Exception]):
+                title = None if error else rotate.index.title(rotate.sheet_id)
+                report(resume(steps, title))
+
+            rotate_program(
+                service,
+                destination_spreadsheet_id,
+                step.sheet_id,
+                step.new_title,
+                step.index,
+                batcher,
+                rotated,
+            )
+            return None
+        else:
+            answer = retry_operation(
+                rotate_program,
+                3,
+                2,
+                service,
+                destination_spreadsheet_id,
+                step.sheet_id,
+                step.new_title,
+                step.index,
+            )
+        step = resume(steps, answer)
+    return step
+
+
+def copy_in_worker(
+    transport: Transport,
+    plan: Plan,
+    planned: PlannedCopy,
+    batcher: Optional[UpdateBatcher] = None,
+    report: Optional[Callable[[CopyResult], None]] = None,
+    journal: Optional[RunJournal] = None,
+) -> Optional[CopyResult]:
+    """
+    Run `copy()` on a worker thread, turning unexpected failures into a result.
+
+    Args:
+        transport (Transport): The transport shared by every worker.
+        plan (Plan): The plan from `make_plan()`.
+        planned (PlannedCopy): The client to copy to.
+        batcher (UpdateBatcher): Queues the renames, see `copy()`.
+        report (callable): Receives the results of queued renames.
+        journal (RunJournal): Records each finished step, see `copy()`.
+    """
+    try:
+        return copy(
+            get_thread_service(transport), plan, planned, batcher, report, journal
+        )
+    except Exception as e:
+        return CopyResult(planned.client.spreadsheet_id, False, f"ERROR: {e}")
+
+
+def copy_to_clients(
+    transport: Transport,
+    plan: Plan,
+    copies: list[PlannedCopy],
+    workers: int,
+    batcher: Optional[UpdateBatcher] = None,
+    journal: Optional[RunJournal] = None,
+) -> list[CopyResult]:
+    """
+    Copy the program to many clients at once using a bounded pool of threads.
+
+    Args:
+        transport (Transport): The transport shared by every worker.
+        plan (Plan): The plan from `make_plan()`.
+        copies (list[PlannedCopy]): The clients to copy to, from the plan.
+        workers (int): The maximum number of copies in flight.
+        batcher (UpdateBatcher): If given, the renames are queued on it and
+            sent in batches.
+        journal (RunJournal): Records each finished step, see `copy()`.
+
+    Returns:
+        list[CopyResult]: One result per client, in the order they finished.
+    """
+    results = []
+
+    def report(result: CopyResult):
+        print(result.message)
+        results.append(result)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                copy_in_worker, transport, plan, planned, batcher, report, journal
+            )
+            for planned in copies
+        ]
+        for future in as_completed(futures):
+            if result := future.result():
+                report(result)
+
+    if batcher is not None:
+        batcher.flush()
+    return results
+
+
+def execute_plan(
+    plan: Plan,
+    service: Resource,
+    transport: Transport,
+    workers: int = 1,
+    use_async: bool = False,
+    batcher: Optional[UpdateBatcher] = None,
+    journal: Optional[RunJournal] = None,
+) -> list[CopyResult]:
+    """
+    Carries out a plan from `make_plan()`.
+
+    Args:
+        plan (Plan): The plan.
+        service (Resource): The Google API service object.
+        transport (Transport): The transport, for worker threads and the
+            credentials and timeouts of the async engine.
+        workers (int): How many clients to copy at once.
+        use_async (bool): Run the copies as coroutines instead of threads.
+        batcher (UpdateBatcher): Queues the renames, see `copy()`.
+        journal (RunJournal): Records each finished step, see `copy()`.
+
+    Returns:
+        list[CopyResult]: One result per client in the plan.
+    """
+    results = []
+
+    def report(result: CopyResult):
+        print(result.message)
+        results.append(result)
+
+    copies = []
+    for planned in plan.copies:
+        if planned.operations:
+            copies.append(planned)
+        else:
+            report(
+                CopyResult(
+                    planned.client.spreadsheet_id,
+                    True,
+                    f'SKIPPED: "{planned.target_title}" sheet is already in '
+                    f"{planned.client.client_name}",
+                )
+            )
+
+    if use_async:
+        import asyncio
+        import aiosheets
+
+        results += asyncio.run(
+            aiosheets.copy_to_clients(
+                transport.credentials,
+                plan,
+                copies,
+                workers,
+                journal,
+                transport.connect_timeout,
+                transport.read_timeout,
+            )
+        )
+    elif workers == 1:
+        for planned in copies:
+            result = copy(service, plan, planned, batcher, report, journal)
+            if result:
+                report(result)
+        if batcher is not None:
+            batcher.flush()
+    else:
+        results += copy_to_clients(transport, plan, copies, workers, batcher, journal)
+    return results
@@ -0,0 +1,136 @@
+"""
+Client-side throttling for the Sheets API quotas.
+
+Sheets counts read and write requests against separate per-minute quotas,
+so every request waits for a token from the matching bucket before it goes
+out. A 429 halves that bucket's rate (and pauses it for any Retry-After the
+server sent); successful requests slowly bring it back up to the quota.
+
+Link:
+    - https://developers.google.com/sheets/api/limits
+"""
+
+import threading
+import time
+from typing import Optional
+
+READ = "read"
+WRITE = "write"
+
+# Per-user quotas for the Sheets API, lower these if you share the project
+READ_REQUESTS_PER_MINUTE = 60
+WRITE_REQUESTS_PER_MINUTE = 60
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket whose rate adapts to throttling.
+
+    Tokens are reserved up front, so callers that arrive while the bucket is
+    empty queue up behind each other instead of all waking at the same time.
+
+    Args:
+        requests_per_minute (float): The quota, and the fastest allowed rate.
+        burst (int): How many requests may go out back to back.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int = 5):
+        self.max_rate = requests_per_minute / 60
+        self.min_rate = self.max_rate / 16
+        self.rate = self.max_rate
+        self.capacity = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Takes a token and returns how many seconds to wait before using it."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        """Blocks until a request may go out."""
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Waits, without blocking the event loop, until a request may go out."""
+        import asyncio
+
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+    def slow_down(self, pause: Optional[float] = None):
+        """
+        Halves the rate after a 429, and holds every caller back for `pause`.
+
+        Args:
+            pause (float): Seconds from the server's Retry-After header.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate / 2)
+            if pause:
+                self._tokens = min(self._tokens, 0) - pause * self.rate
+
+    def speed_up(self):
+        """Creeps back towards the quota after a request goes through."""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 32)
+
+
+class QuotaLimiter:
+    """
+    One bucket per Sheets quota, shared by everything that talks to the API.
+
+    Args:
+        read_per_minute (float): The read request quota.
+        write_per_minute (float): The write request quota.
+    """
+
+    def __init__(
+        self,
+        read_per_minute: float = READ_REQUESTS_PER_MINUTE,
+        write_per_minute: float = WRITE_REQUESTS_PER_MINUTE,
+    ):
+        self.buckets = {
+            READ: TokenBucket(read_per_minute),
+            WRITE: TokenBucket(write_per_minute),
+        }
+
+    def acquire(self, kind: str):
+        """Blocks until a `kind` request may go out."""
+        self.buckets[kind].acquire()
+
+    async def acquire_async(self, kind: str):
+        """Waits until a `kind` request may go out."""
+        await self.buckets[kind].acquire_async()
+
+    def throttled(self, kind: str, retry_after: Optional[float] = None):
+        """Backs off after the server answered a `kind` request with 429."""
+        self.buckets[kind].slow_down(retry_after)
+
+    def succeeded(self, kind: str):
+        """Notes that a `kind` request went through."""
+        self.buckets[kind].speed_up()
+
+
+def request_kind(method: str) -> str:
+    """Returns which quota an HTTP method counts against."""
+    return READ if method.upper() == "GET" else WRITE
+
+
+# The limiter every request in the process goes through
+LIMITER = QuotaLimiter()
@@ -0,0 +1,121 @@
+"""
+Builds Sheets API service objects from a vendored discovery document.
+
+`build("sheets", "v4")` looks up and parses the ~300 KB discovery document
+every time it's called. The copy in `discovery/sheets.v4.json` is pinned to
+revision 20240917 (shipped with google-api-python-client 2.149.0) and is
+parsed at most once per process. To update it, copy
+`googleapiclient/discovery_cache/documents/sheets.v4.json` from a newer
+google-api-python-client over it.
+
+googleapiclient also builds a new resource, generating every method and
+its docstring, on each call to `service.spreadsheets()`, `.values()` and
+`.sheets()`. The docstrings pretty-print the request and response schemas,
+~40 ms of CPU (~300 ms for a new service) holding the GIL, for every
+request a worker makes. The services built here leave those examples out
+of the docstrings (`shared_schemas()`) and keep each nested resource once
+it's built (`cache_resources()`). Both rely on attributes googleapiclient
+doesn't document (`RESOURCE_INTERNALS`). If a release drops any of them,
+services are built the plain way instead, slower but working.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+import json
+import os
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from googleapiclient.discovery import Resource
+    from googleapiclient.schema import Schemas
+
+DISCOVERY_DOCUMENT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "discovery", "sheets.v4.json"
+)
+
+# The private parts of googleapiclient's Resource used here, present from
+# 1.x through 2.149.0 (see requirements.in)
+RESOURCE_INTERNALS = (
+    "_schema",
+    "_dynamic_attrs",
+    "_set_service_methods",
+    "_resourceDesc",
+)
+
+
+@lru_cache(maxsize=None)
+def discovery_document() -> dict:
+    """Returns the parsed Sheets v4 discovery document."""
+    with open(DISCOVERY_DOCUMENT) as document:
+        return json.load(document)
+
+
+@lru_cache(maxsize=None)
+def shared_schemas() -> Schemas:
+    """Returns the document's schemas, naming each one in docstrings instead of printing it."""
+    from googleapiclient.schema import Schemas
+
+    class UndocumentedSchemas(Schemas):
+        def prettyPrintByName(self, name: str) -> str:
+            return f"# Object with schema name: {name}"
+
+        def prettyPrintSchema(self, schema: dict) -> str:
+            return f"# Object with schema name: {schema.get('$ref', 'object')}"
+
+    return UndocumentedSchemas(discovery_document())
+
+
+def build_service(
+    credentials=None, http=None, root_url: Optional[str] = None
+) -> Resource:
+    """
+    Builds a Sheets v4 service without fetching or re-parsing its discovery document.
+
+    Args:
+        credentials (Credentials): The credentials to authorize with.
+        http (httplib2.Http): An already authorized HTTP object, instead of
+            `credentials`.
+        root_url (str): Sends every request, batches included, somewhere
+            other than https://sheets.googleapis.com/, e.g. the fake server
+            in `benchmarks/fake_sheets.py`.
+    """
+    from googleapiclient.discovery import build_from_document
+
+    document = discovery_document()
+    if root_url is not None:
+        document = {**document, "rootUrl": root_url}
+    service = build_from_document(document, credentials=credentials, http=http)
+    if not all(hasattr(service, name) for name in RESOURCE_INTERNALS):
+        return service
+    # The methods were set up with schemas of their own, redo them with ours
+    service._schema = shared_schemas()
+    service._dynamic_attrs.clear()
+    service._set_service_methods()
+    return cache_resources(service)
+
+
+def cache_resources(resource: Resource) -> Resource:
+    """
+    Makes each nested resource of `resource` be built on first use, then reused.
+
+    Args:
+        resource (Resource): A service, or one of its resources.
+
+    Returns:
+        Resource: `resource` itself.
+    """
+    from googleapiclient.discovery import fix_method_name
+
+    for name in resource._resourceDesc.get("resources", {}):
+        attribute = fix_method_name(name)
+        setattr(resource, attribute, _built_once(getattr(resource, attribute)))
+    return resource
+
+
+def _built_once(build_nested):
+    @lru_cache(maxsize=None)
+    def nested() -> Resource:
+        return cache_resources(build_nested())
+
+    return nested
@@ -0,0 +1,164 @@
+"""
+Splits a run across processes, each signed in as a different identity.
+
+Sheets write quotas are per user and project, so one identity can only
+copy to so many clients a minute however well it's tuned. With
+`--shard-credentials` the clients are divided by a stable hash of their
+spreadsheet ID, one shard per credentials file (a service account key or
+a saved user token), and each shard is run in its own process with its
+own rate limiter. The shards' results and API calls are merged back into
+one report.
+"""
+
+from __future__ import annotations
+
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import multiprocessing
+from typing import TYPE_CHECKING
+
+from metrics import METRICS
+
+if TYPE_CHECKING:
+    from planner import Plan
+
+ShardResult = namedtuple("ShardResult", ["credentials_file", "results", "calls"])
+
+
+def shard_of(spreadsheet_id: str, shards: int) -> int:
+    """
+    Returns which shard a client belongs to, the same in every run and process.
+
+    Args:
+        spreadsheet_id (str): The client spreadsheet ID.
+        shards (int): How many shards there are.
+    """
+    digest = hashlib.sha256(spreadsheet_id.encode()).digest()
+    return int.from_bytes(digest[:8], "big") % shards
+
+
+def shard_plan(plan: Plan, shards: int) -> list[Plan]:
+    """
+    Splits a plan into `shards` plans, by client.
+
+    Args:
+        plan (Plan): The plan from `planner.make_plan()`.
+        shards (int): How many shards to split it into.
+    """
+    copies = [[] for _ in range(shards)]
+    for planned in plan.copies:
+        copies[shard_of(planned.client.spreadsheet_id, shards)].append(planned)
+    return [plan._replace(copies=tuple(shard)) for shard in copies]
+
+
+def run_shard(
+    plan: Plan,
+    credentials_file: str,
+    scopes: list[str],
+    args: argparse.Namespace,
+) -> ShardResult:
+    """
+    Carries out one shard of a plan. Runs in a worker process.
+
+    Args:
+        plan (Plan): The shard's part of the plan.
+        credentials_file (str): The identity this shard runs as.
+        scopes (list[str]): The scopes the credentials need.
+        args (argparse.Namespace): The options the run was started with.
+    """
+    from contextlib import nullcontext
+
+    from auth import load_credentials_file
+    from batching import UpdateBatcher
+    from journal import RunJournal
+    from programs import execute_plan
+    from service import build_service
+    from transport import TRANSPORTS
+
+    transport = TRANSPORTS[args.transport](
+        load_credentials_file(credentials_file, scopes),
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout,
+    )
+    journal_context = RunJournal(args.journal) if args.journal else nullcontext()
+    with (
+        build_service(http=transport.http()) as service,
+        journal_context as journal,
+        METRICS.start(),
+    ):
+        results = execute_plan(
+            plan,
+            service,
+            transport,
+            args.workers,
+            args.use_async,
+            UpdateBatcher(service) if args.batch else None,
+            journal,
+        )
+    return ShardResult(credentials_file, results, METRICS.calls())
+
+
+def run_shards(
+    plan: Plan,
+    credentials_files: list[str],
+    scopes: list[str],
+    args: argparse.Namespace,
+) -> list:
+    """
+    Carries out a plan in one process per credentials file.
+
+    Every call the shards made is added to `METRICS`, so the run summary
+    covers all of them.
+
+    Args:
+        plan (Plan): The whole plan.
+        credentials_files (list[str]): One credentials file per shard.
+        scopes (list[str]): The scopes the credentials need.
+        args (argparse.Namespace): The options the run was started with.
+
+    Returns:
+        list[CopyResult]: One result per client in the plan. The clients of
+            a shard that failed as a whole are reported as errors.
+    """
+    from programs import CopyResult
+
+    shards = shard_plan(plan, len(credentials_files))
+    results = []
+    # Start each worker from a clean interpreter rather than a fork of this
+    # one, with its open connections, journal and threads
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(len(credentials_files), mp_context=context) as pool:
+        futures = {
+            pool.submit(run_shard, shard, credentials_file, scopes, args): (
+                shard,
+                credentials_file,
+            )
+            for shard, credentials_file in zip(shards, credentials_files)
+            if shard.copies
+        }
+        for future in as_completed(futures):
+            shard, credentials_file = futures[future]
+            try:
+                shard_result = future.result()
+            except Exception as e:
+                print(f"ERROR: shard {credentials_file} failed: {e}")
+                results += [
+                    CopyResult(
+                        planned.client.spreadsheet_id,
+                        False,
+                        f"ERROR: shard {credentials_file} failed",
+                    )
+                    for planned in shard.copies
+                ]
+                continue
+
+            METRICS.extend(shard_result.calls)
+            results += shard_result.results
+            succeeded = sum(result.ok for result in shard_result.results)
+            print(
+                f"Shard {credentials_file}: "
+                f"{succeeded}/{len(shard_result.results)} clients"
+            )
+    return results
@@ -0,0 +1,159 @@
+"""
+An index of the sheets in one client spreadsheet.
+
+It's read once per destination with a small field mask, then updated in
+place as sheets are copied in, renamed, hidden and moved, so nothing has to
+fetch the whole spreadsheet again to find out which titles are taken or
+which program came before.
+"""
+
+import re
+from typing import Optional
+
+# The only parts of a spreadsheet the index needs
+SHEET_INDEX_FIELDS = "properties.title,sheets.properties(sheetId,title,index,hidden)"
+
+# Program sheets are titled like "602 - 10/26", maybe with a " (1)" suffix
+PROGRAM_TITLE = re.compile(
+    r"^(?P<program>.+) - (?P<month>\d{2})/(?P<year>\d{2})(?: \(\d+\))?$"
+)
+
+
+def program_month(title: str) -> Optional[tuple[int, int]]:
+    """
+    Returns the (year, month) of a program sheet title, or None if it isn't one.
+
+    Args:
+        title (str): A sheet title, e.g. "602 - 10/26".
+    """
+    match = PROGRAM_TITLE.match(title)
+    if not match:
+        return None
+    return int(match["year"]), int(match["month"])
+
+
+class SheetIndex:
+    """
+    The properties of every sheet in a spreadsheet, keyed by sheet ID.
+
+    Args:
+        spreadsheet_id (str): The spreadsheet ID.
+        spreadsheet_title (str): The title of the spreadsheet itself.
+        sheets (list[dict]): Sheet properties with sheetId, title, index and
+            hidden.
+    """
+
+    def __init__(self, spreadsheet_id: str, spreadsheet_title: str, sheets: list[dict]):
+        self.spreadsheet_id = spreadsheet_id
+        self.spreadsheet_title = spreadsheet_title
+        self._sheets = {}
+        for properties in sheets:
+            self.add_sheet(properties)
+
+    @classmethod
+    def from_response(cls, spreadsheet_id: str, spreadsheet: dict) -> "SheetIndex":
+        """
+        Builds the index from a `spreadsheets().get()` response.
+
+        Args:
+            spreadsheet_id (str): The spreadsheet ID.
+            spreadsheet (dict): The response, read with `SHEET_INDEX_FIELDS`.
+        """
+        return cls(
+            spreadsheet_id,
+            spreadsheet["properties"]["title"],
+            [sheet["properties"] for sheet in spreadsheet.get("sheets", [])],
+        )
+
+    def __contains__(self, title: str) -> bool:
+        return title in self.titles()
+
+    def add_sheet(self, properties: dict):
+        """
+        Records a sheet, e.g. the properties returned by copyTo.
+
+        Args:
+            properties (dict): The sheet's properties.
+        """
+        sheet_id = properties["sheetId"]
+        self._sheets[sheet_id] = {
+            "sheetId": sheet_id,
+            "title": properties["title"],
+            "index": properties.get("index", len(self._sheets)),
+            "hidden": properties.get("hidden", False),
+        }
+
+    def has_sheet(self, sheet_id: int) -> bool:
+        """Returns True if the spreadsheet still has the sheet."""
+        return sheet_id in self._sheets
+
+    def sheet_id(self, title: str) -> Optional[int]:
+        """Returns the ID of the sheet with `title`, or None if there isn't one."""
+        for sheet in self._sheets.values():
+            if sheet["title"] == title:
+                return sheet["sheetId"]
+        return None
+
+    def title(self, sheet_id: int) -> str:
+        """Returns the title of a sheet."""
+        return self._sheets[sheet_id]["title"]
+
+    def titles(self) -> set[str]:
+        """Returns every title in the spreadsheet."""
+        return {sheet["title"] for sheet in self._sheets.values()}
+
+    def set_title(self, sheet_id: int, title: str):
+        """Records a sheet that was renamed."""
+        self._sheets[sheet_id]["title"] = title
+
+    def hide(self, sheet_id: int):
+        """Records a sheet that was hidden."""
+        self._sheets[sheet_id]["hidden"] = True
+
+    def move(self, sheet_id: int, new_index: int):
+        """Records a sheet that was moved, shifting the sheets in between."""
+        old_index = self._sheets[sheet_id]["index"]
+        for sheet in self._sheets.values():
+            if new_index <= sheet["index"] < old_index:
+                sheet["index"] += 1
+            elif old_index < sheet["index"] <= new_index:
+                sheet["index"] -= 1
+        self._sheets[sheet_id]["index"] = new_index
+
+    def unique_title(self, new_title: str) -> str:
+        """
+        Returns the title unchanged, or with a number appended if it's already taken.
+
+        Args:
+            new_title (str): The desired new title for the sheet.
+        """
+        existing_titles = self.titles()
+        base_title = new_title
+        counter = 1
+        while new_title in existing_titles:
+            new_title = f"{base_title} ({counter})"
+            counter += 1
+        return new_title
+
+    def previous_program(self, title: str) -> Optional[int]:
+        """
+        Returns the sheet ID of the latest visible program before `title`.
+
+        Args:
+            title (str): The title of the new program, e.g. "602 - 10/26".
+
+        Returns:
+            int: The sheet ID, or None if there's no earlier program showing.
+        """
+        current = program_month(title)
+        if current is None:
+            return None
+
+        candidates = [
+            (month, -sheet["index"], sheet["sheetId"])
+            for sheet in self._sheets.values()
+            if not sheet["hidden"]
+            and (month := program_month(sheet["title"])) is not None
+            and month < current
+        ]
+        return max(candidates)[2] if candidates else None
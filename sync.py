@@ -0,0 +1,279 @@
+"""
+Pushes fixes made to a template after the monthly run into the copies.
+
+Instead of copying the whole sheet again, the template and each client's
+"PROGRAM - MM/YY" sheet are read, the cells the template fills in are
+compared, and only the cells that differ go out, in one values().batchUpdate
+per client.
+
+Cells that are blank in the template are where clients write their own
+entries, so they're never touched. The flip side is that clearing a cell
+in the template isn't synced, since there's no telling it apart from a
+client's entry.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional
+
+from googleapiclient.errors import HttpError
+
+from helpers import execute, retry_operation
+from metrics import CURRENT_CLIENT
+from programs import CopyResult, get_sheet_index, get_thread_service
+
+if TYPE_CHECKING:
+    from googleapiclient.discovery import Resource
+
+    from catalog import Template
+    from transport import Transport
+
+# Formulas are read and written as formulas, not as the values they show
+VALUE_RENDER_OPTION = "FORMULA"
+VALUE_INPUT_OPTION = "USER_ENTERED"
+
+# The cells of a row the template fills in, by column
+TemplateRow = dict[int, object]
+
+# What reading a client's sheet gives when the sheet isn't there
+NO_SHEET = object()
+
+
+def quote_title(title: str) -> str:
+    """Returns a sheet title quoted for use in an A1 range."""
+    return "'" + title.replace("'", "''") + "'"
+
+
+def column_letters(column: int) -> str:
+    """Returns the letters of a 0-based column, e.g. 0 -> "A", 27 -> "AB"."""
+    letters = ""
+    column += 1
+    while column:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def read_sheet(service: Resource, spreadsheet_id: str, title: str) -> list[list]:
+    """
+    Reads every cell of a sheet, with formulas rather than their results.
+
+    Args:
+        service (Resource): The Google API service object.
+        spreadsheet_id (str): The spreadsheet ID.
+        title (str): The sheet title.
+    """
+    result = execute(
+        service.spreadsheets()
+        .values()
+        .get(
+            spreadsheetId=spreadsheet_id,
+            range=quote_title(title),
+            valueRenderOption=VALUE_RENDER_OPTION,
+        )
+    )
+    return result.get("values", [])
+
+
+def template_rows(rows: list[list]) -> list[TemplateRow]:
+    """
+    Returns the cells the template fills in, row by row.
+
+    Args:
+        rows (list[list]): The template's values from `read_sheet()`.
+    """
+    return [
+        {column: value for column, value in enumerate(row) if value != ""}
+        for row in rows
+    ]
+
+
+def changed_ranges(
+    title: str, template: list[TemplateRow], client_rows: list[list]
+) -> list[dict]:
+    """
+    Compares a client's sheet with the template and returns the cells to update.
+
+    Args:
+        title (str): The client's sheet title.
+        template (list[TemplateRow]): From `template_rows()`.
+        client_rows (list[list]): The client's values from `read_sheet()`.
+
+    Returns:
+        list[dict]: ValueRanges for values().batchUpdate, one per run of
+            adjacent changed cells.
+    """
+    ranges = []
+    for row_number, template_cells in enumerate(template, start=1):
+        if not template_cells:
+            continue
+        client_row = (
+            client_rows[row_number - 1] if row_number <= len(client_rows) else []
+        )
+        changed = [
+            column
+            for column in sorted(template_cells)
+            if (client_row[column] if column < len(client_row) else "")
+            != template_cells[column]
+        ]
+        if not changed:
+            continue
+
+        run = [changed[0]]
+        for column in changed[1:] + [None]:
+            if column is not None and column == run[-1] + 1:
+                run.append(column)
+                continue
+            ranges.append(
+                {
+                    "range": f"{quote_title(title)}!{column_letters(run[0])}"
+                    f"{row_number}:{column_letters(run[-1])}{row_number}",
+                    "values": [[template_cells[cell] for cell in run]],
+                }
+            )
+            run = [column]
+    return ranges
+
+
+def sync_client(
+    service: Resource,
+    spreadsheet_id: str,
+    title: str,
+    template: list[TemplateRow],
+    dry_run: bool = False,
+) -> CopyResult:
+    """
+    Brings one client's program sheet up to date with the template.
+
+    Args:
+        service (Resource): The Google API service object.
+        spreadsheet_id (str): The client spreadsheet ID.
+        title (str): The client's program sheet, e.g. "602 - 10/26".
+        template (list[TemplateRow]): From `template_rows()`.
+        dry_run (bool): Only report what would change.
+    """
+    CURRENT_CLIENT.set(spreadsheet_id)
+
+    def read_client_sheet():
+        try:
+            return read_sheet(service, spreadsheet_id, title)
+        except HttpError as e:
+            # A range naming a sheet that doesn't exist is a 400
+            if e.status_code == 400:
+                return NO_SHEET
+            raise
+
+    client_rows = retry_operation(read_client_sheet)
+    if client_rows is NO_SHEET:
+        return CopyResult(
+            spreadsheet_id, True, f'SKIPPED: no "{title}" sheet in {spreadsheet_id}'
+        )
+    if client_rows is None:
+        return CopyResult(
+            spreadsheet_id,
+            False,
+            f'ERROR: could not read "{title}" in {spreadsheet_id}',
+        )
+
+    ranges = changed_ranges(title, template, client_rows)
+    if not ranges:
+        return CopyResult(
+            spreadsheet_id,
+            True,
+            f'SKIPPED: "{title}" in {spreadsheet_id} already matches the template',
+        )
+    cells = sum(len(value_range["values"][0]) for value_range in ranges)
+    if dry_run:
+        return CopyResult(
+            spreadsheet_id,
+            True,
+            f'PLAN: would update {cells} cells of "{title}" in {spreadsheet_id}',
+        )
+
+    response = retry_operation(
+        lambda: execute(
+            service.spreadsheets()
+            .values()
+            .batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={"valueInputOption": VALUE_INPUT_OPTION, "data": ranges},
+            )
+        )
+    )
+    if response is None:
+        return CopyResult(
+            spreadsheet_id,
+            False,
+            f'ERROR: could not update "{title}" in {spreadsheet_id}',
+        )
+    return CopyResult(
+        spreadsheet_id,
+        True,
+        f'SUCCESS: updated {cells} cells of "{title}" in {spreadsheet_id}',
+    )
+
+
+def sync_clients(
+    service: Resource,
+    transport: Transport,
+    template: Template,
+    clients: list,
+    title: str,
+    workers: int = 1,
+    dry_run: bool = False,
+) -> list[CopyResult]:
+    """
+    Pushes changes in the template to every client's program sheet.
+
+    Args:
+        service (Resource): The Google API service object.
+        transport (Transport): The transport, for worker threads.
+        template (Template): The template the programs were copied from.
+        clients (list[Client]): The clients to sync.
+        title (str): The title of the clients' program sheets.
+        workers (int): How many clients to sync at once.
+        dry_run (bool): Only report what would change, and how many clients.
+
+    Returns:
+        list[CopyResult]: One result per client.
+    """
+    index = retry_operation(get_sheet_index, 3, 2, service, template.spreadsheet_id)
+    if index is None or not index.has_sheet(template.sheet_id):
+        print(f"ERROR: could not read the template {template.program_name}")
+        return []
+    rows = retry_operation(
+        read_sheet,
+        3,
+        2,
+        service,
+        template.spreadsheet_id,
+        index.title(template.sheet_id),
+    )
+    if rows is None:
+        print(f"ERROR: could not read the template {template.program_name}")
+        return []
+    template_cells = template_rows(rows)
+
+    def sync_in_worker(spreadsheet_id: str) -> Optional[CopyResult]:
+        try:
+            client_service = service if workers == 1 else get_thread_service(transport)
+            return sync_client(
+                client_service, spreadsheet_id, title, template_cells, dry_run
+            )
+        except Exception as e:
+            return CopyResult(spreadsheet_id, False, f"ERROR: {e}")
+
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(
+            sync_in_worker, [client.spreadsheet_id for client in clients]
+        ):
+            print(result.message)
+            results.append(result)
+
+    if dry_run:
+        # Nothing was written, so end with what would be, as `print_plan()` does
+        to_sync = sum(result.message.startswith("PLAN:") for result in results)
+        print(f"{to_sync}/{len(results)} clients to sync")
+    return results
@@ -0,0 +1,191 @@
+"""
+The HTTP transports a Sheets service can send its requests through.
+
+`Transport` is what googleapiclient does by default: an authorized
+httplib2 connection, one per thread since httplib2 can't be shared.
+`PooledTransport` gives every thread the same pooled httpx client instead,
+so connections (and their TLS handshakes) are kept alive and reused by all
+the workers, with gzip'd responses and separate connect/read timeouts.
+
+    transport = PooledTransport(creds)
+    service = build_service(http=transport.http())
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import httplib2
+
+# Seconds to wait for a connection, and then for each response
+CONNECT_TIMEOUT = 10.0
+READ_TIMEOUT = 60.0
+
+# Connections kept open by a pooled transport, shared by every worker
+MAX_CONNECTIONS = 100
+
+
+class Transport:
+    """
+    A new authorized httplib2 connection for each service.
+
+    Args:
+        credentials (Credentials): The credentials to authorize with.
+        connect_timeout (float): Not used by httplib2, which has a single
+            timeout, but kept for the async engine.
+        read_timeout (float): Seconds to wait on the socket.
+        max_connections (int): Ignored, each connection serves one thread.
+    """
+
+    def __init__(
+        self,
+        credentials,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        max_connections: int = MAX_CONNECTIONS,
+    ):
+        self.credentials = credentials
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    def http(self):
+        """Returns an HTTP object for one service, on one thread."""
+        import google_auth_httplib2
+        import httplib2
+
+        return google_auth_httplib2.AuthorizedHttp(
+            self.credentials, http=httplib2.Http(timeout=self.read_timeout)
+        )
+
+
+class PooledTransport(Transport):
+    """
+    One pooled, keep-alive httpx client shared by every service and thread.
+
+    Args:
+        credentials (Credentials): The credentials to authorize with.
+        connect_timeout (float): Seconds to wait for a new connection.
+        read_timeout (float): Seconds to wait for each response.
+        max_connections (int): How many connections the pool keeps open.
+    """
+
+    def __init__(
+        self,
+        credentials,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        max_connections: int = MAX_CONNECTIONS,
+    ):
+        super().__init__(credentials, connect_timeout, read_timeout, max_connections)
+        self._http = PooledHttp(
+            credentials, connect_timeout, read_timeout, max_connections
+        )
+
+    def http(self) -> PooledHttp:
+        return self._http
+
+
+class PooledHttp:
+    """
+    Stands in for `httplib2.Http` in googleapiclient, over a pooled httpx client.
+
+    It's safe to use from many threads at once. Requests are authorized
+    with `credentials`, refreshing them once and sending again on a 401, as
+    `google_auth_httplib2.AuthorizedHttp` does.
+
+    Args:
+        credentials (Credentials): The credentials to authorize with, or None.
+        connect_timeout (float): Seconds to wait for a new connection.
+        read_timeout (float): Seconds to wait for each response.
+        max_connections (int): How many connections the pool keeps open.
+    """
+
+    def __init__(
+        self,
+        credentials=None,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        max_connections: int = MAX_CONNECTIONS,
+    ):
+        import httpx
+
+        # googleapiclient looks for this to authorize the parts of a batch
+        self.credentials = credentials
+        self._client = httpx.Client(
+            headers={"Accept-Encoding": "gzip"},
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+        self._auth_request = None
+
+    def request(
+        self,
+        uri: str,
+        method: str = "GET",
+        body=None,
+        headers: Optional[dict] = None,
+        redirections: int = 5,
+        connection_type=None,
+    ) -> tuple[httplib2.Response, bytes]:
+        """
+        Sends a request, with the same signature and result as `httplib2.Http.request()`.
+
+        Raises:
+            TimeoutError: If connecting or reading timed out.
+            ConnectionError: If the request couldn't be sent.
+        """
+        import httplib2
+        import httpx
+
+        for attempt in range(2):
+            request_headers = dict(headers or {})
+            if self.credentials is not None:
+                self.credentials.before_request(
+                    self._refresh_request(), method, uri, request_headers
+                )
+            try:
+                response = self._client.request(
+                    method,
+                    uri,
+                    content=body,
+                    headers=request_headers,
+                    follow_redirects=redirections > 0,
+                )
+            except httpx.TimeoutException as e:
+                raise TimeoutError(str(e)) from e
+            except httpx.TransportError as e:
+                raise ConnectionError(str(e)) from e
+
+            if response.status_code != 401 or self.credentials is None or attempt:
+                break
+            self.credentials.refresh(self._refresh_request())
+
+        # httpx already decoded the body, so drop what described the encoded one
+        info = {
+            name: value
+            for name, value in response.headers.items()
+            if name not in ("content-encoding", "content-length")
+        }
+        info["status"] = str(response.status_code)
+        resp = httplib2.Response(info)
+        resp.reason = response.reason_phrase
+        return resp, response.content
+
+    def _refresh_request(self):
+        if self._auth_request is None:
+            from google.auth.transport.requests import Request
+
+            self._auth_request = Request()
+        return self._auth_request
+
+    def close(self):
+        """Closes every pooled connection."""
+        self._client.close()
+
+
+# The transports `--transport` can pick
+TRANSPORTS = {"httplib2": Transport, "pooled": PooledTransport}